@@ -0,0 +1,215 @@
+"""How the library core scales with the number of books.
+
+Usage:
+    python benchmarks/bench_library.py [--sizes 1000,100000,1000000]
+        [--backend json] [--repeat 200] [--output results.json]
+        [--baseline baseline.json] [--tolerance 1.25]
+
+This drives core.py and the repositories directly.  No Streamlit or pandas
+is imported, so the numbers are for the library code alone.  For every size,
+a library of that many generated books is written to a temp directory.
+Then these cases are timed:
+
+* load:   opening the library (reading it and building the indexes)
+* save:   writing every book back (JSON only; SQLite commits each change)
+* add, update, delete: one core.add_book/update_book/delete_book call
+* search: a one-word prefix search and a two-word search
+* fuzzy:  fuzzy_search for a title word or author name with one letter changed
+* find:   all books in one genre and decade
+* order:  the ids of one decade's books, sorted by year, title, author or date added
+
+Each case reports p50/p90/max latency in milliseconds.  load runs once and
+save a few times; the other cases run --repeat times.  The script also
+checks that importing core did not pull in Streamlit or pandas.
+
+Results are written as JSON.  With --baseline, each case's p50 is compared
+to the baseline, and the script exits with status 1 if any case is slower
+by more than --tolerance times.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import core
+from library import make_book, write_library
+from ordering import SORT_KEYS
+
+GENRES = ["Fantasy", "Science Fiction", "Mystery", "Romance", "History", "Biography",
+          "Poetry", "Horror", "Travel", "Philosophy"]
+SLOW_REPEAT = 3     # runs of save, which writes every book
+FORBIDDEN = {"streamlit", "pandas"}
+
+
+def words(rnd, count):
+    """Pronounceable made-up words, so the search index sees a realistic vocabulary."""
+    syllables = ["ka", "lo", "mi", "ran", "tor", "el", "shi", "vu", "den", "ar", "qua", "zen",
+                 "bel", "dor", "fin", "gas", "hun", "jor", "lis", "mor", "nel", "pra", "sto", "wyn"]
+    return sorted({"".join(rnd.choice(syllables) for _ in range(rnd.randint(2, 4)))
+                   for _ in range(count)})
+
+
+def generate_books(size, seed=1):
+    """Yield size books with made-up titles and authors; the same books for the same seed."""
+    rnd = random.Random(seed)
+    vocabulary = words(rnd, 50000)
+    authors = [f"{rnd.choice(vocabulary).title()} {rnd.choice(vocabulary).title()}"
+               for _ in range(max(10, size // 20))]
+    for i in range(size):
+        title = " ".join(rnd.choice(vocabulary) for _ in range(rnd.randint(1, 4))).title()
+        yield make_book(title, rnd.choice(authors), rnd.choice(GENRES), rnd.randint(1800, 2024),
+                        f"isbn-{i}")
+
+
+def generate(directory, backend, size):
+    """Write a library of size books; return its path."""
+    path = os.path.join(directory, core.BACKENDS[backend])
+    if backend == "json":
+        write_library(path, list(generate_books(size)))
+    else:
+        repository = core.open_repository(backend, path)
+        batch = []
+        for book in generate_books(size):
+            batch.append(book)
+            if len(batch) == 10000:
+                repository.import_books(batch)
+                batch.clear()
+        repository.import_books(batch)
+        repository.conn.close()
+    return path
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summary(times):
+    return {"p50_ms": round(percentile(times, 0.5) * 1000, 3),
+            "p90_ms": round(percentile(times, 0.9) * 1000, 3),
+            "max_ms": round(max(times) * 1000, 3)}
+
+
+def timed(run, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        run(i)
+        times.append(time.perf_counter() - start)
+    return summary(times)
+
+
+def typo(word, rnd):
+    """word with one letter (not the first) replaced."""
+    i = rnd.randrange(1, len(word))
+    return word[:i] + rnd.choice("aeiouxyz".replace(word[i], "")) + word[i + 1:]
+
+
+def checked(error):
+    if error:
+        raise SystemExit(f"benchmark operation failed: {error}")
+
+
+def run_cases(backend, path, repeat):
+    """Yield (case name, summary) for one library file."""
+    # once only: a JSON repository lives as long as its save thread, so each
+    # extra load would keep another copy of the library in memory
+    start = time.perf_counter()
+    repository = core.open_repository(backend, path)
+    yield "load", summary([time.perf_counter() - start])
+    ids = [book["id"] for book in repository.iter_books()]
+    rnd = random.Random(2)
+
+    if backend == "json":
+        def save(_):
+            write_library(path, repository.all())
+        yield "save", timed(save, SLOW_REPEAT)
+
+    yield "add", timed(lambda i: checked(core.add_book(
+        repository, f"Benchmark Book {i}", "Bench Author", "Fantasy", 2000, f"bench-{i}")), repeat)
+    yield "update", timed(lambda i: checked(core.update_book(
+        repository, rnd.choice(ids), f"Updated Title {i}", "Bench Author", "Mystery", 1999, f"upd-{i}")),
+        repeat)
+    doomed = rnd.sample(ids, min(repeat, len(ids) // 2))
+    yield "delete", timed(lambda i: checked(core.delete_book(repository, doomed[i])), len(doomed))
+
+    queries = ["ka", "lo mi"]
+    yield "search", timed(lambda i: repository.search(queries[i % len(queries)]), repeat)
+    deleted = set(doomed)
+    samples = [repository.get(book_id) for book_id in rnd.sample(ids, 40) if book_id not in deleted][:20]
+    typos = [typo(rnd.choice(book["title"].lower().split()), rnd) for book in samples[:10]]
+    typos += [" ".join(typo(word, rnd) for word in book["author"].lower().split()) for book in samples[10:]]
+    yield "fuzzy", timed(lambda i: repository.fuzzy_search(typos[i % len(typos)]), repeat)
+    yield "find", timed(lambda i: repository.find(genre=GENRES[i % len(GENRES)],
+                                                  year_from=1950, year_to=1959), repeat)
+    sort_keys = list(SORT_KEYS)
+    yield "order", timed(lambda i: repository.ordered_ids(sort_keys[i % len(sort_keys)],
+                                                          year_from=1950, year_to=1959), repeat)
+    repository.flush()
+
+
+def compare(results, baseline, tolerance):
+    """Print p50 against the baseline; return the number of regressions."""
+    old = {(case["size"], case["case"]): case for case in baseline["cases"]}
+    regressions = 0
+    for case in results["cases"]:
+        before = old.get((case["size"], case["case"]))
+        if not before:
+            continue
+        ratio = case["p50_ms"] / max(before["p50_ms"], 0.001)
+        flag = ""
+        if ratio > tolerance:
+            flag = "  <-- REGRESSION"
+            regressions += 1
+        print(f"{case['size']:>8} {case['case']:<7} "
+              f"{before['p50_ms']:>10.3f} -> {case['p50_ms']:>10.3f} ms  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--backend", choices=sorted(core.BACKENDS), default="json")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+    imported = FORBIDDEN & set(sys.modules)
+    if imported:
+        raise SystemExit(f"importing core pulled in {', '.join(sorted(imported))}")
+
+    results = {"backend": args.backend, "python": platform.python_version(),
+               "platform": platform.platform(), "cases": []}
+    for size in (int(size) for size in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            path = generate(directory, args.backend, size)
+            print(f"{size} books generated in {time.perf_counter() - start:.1f}s")
+            for name, case in run_cases(args.backend, path, args.repeat):
+                case.update(size=size, case=name)
+                results["cases"].append(case)
+                print(f"{size:>8} {name:<7} p50 {case['p50_ms']:>10.3f} ms"
+                      f"  p90 {case['p90_ms']:>10.3f} ms  max {case['max_ms']:>10.3f} ms")
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            raise SystemExit(f"{regressions} case(s) slower than the baseline")
+
+
+if __name__ == "__main__":
+    main()
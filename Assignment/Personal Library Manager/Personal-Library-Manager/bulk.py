@@ -0,0 +1,135 @@
+"""Bulk import and export of books as CSV or JSON Lines.
+
+Rows are read and written one at a time.  Imports are added in batches of
+BATCH_SIZE books, so memory stays bounded however big the file is, and each
+batch is a single write to the library: one transaction for SQLite, one
+background save for JSON.  Every row goes through the same checks as the
+Add Book form.  A book whose ISBN is already in the library, or appeared
+earlier in the file, is skipped.
+
+Usage:
+    python bulk.py import books.csv [--backend json|sqlite] [--data PATH]
+    python bulk.py export books.jsonl [--backend json|sqlite] [--data PATH]
+
+With the JSON backend, stop the app first.  It holds its own copy of the
+library and would overwrite an import on its next save.
+"""
+import argparse
+import csv
+import json
+import os
+from core import BACKENDS, open_repository
+from library import make_book, validate_book
+
+BATCH_SIZE = 1000
+FIELDS = ["id", "title", "author", "genre", "year_published", "isbn", "added_date"]
+MAX_ERRORS = 20     # how many bad rows to describe in the report
+
+
+def file_format(path):
+    """'csv' or 'jsonl', from the file name."""
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+NOT_JSON = object()      # stands in for a JSON Lines row that does not parse
+
+
+def read_rows(file, fmt):
+    """Yield one dict per book from an open text file; NOT_JSON for a bad line."""
+    if fmt == "csv":
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield NOT_JSON
+
+
+def text(value):
+    """A field as a string; JSON Lines rows may hold numbers or nulls."""
+    return "" if value is None else str(value)
+
+
+def import_books(repository, rows, batch_size=BATCH_SIZE):
+    """Validate rows and add them in batches; return a report dict.
+
+    Duplicate ISBNs are left to repository.add_many, which skips them both
+    against the library and within the batch.
+    """
+    report = {"added": 0, "skipped": 0, "invalid": 0, "errors": []}
+    batch = []
+
+    def commit():
+        added = repository.add_many(batch)
+        report["added"] += added
+        report["skipped"] += len(batch) - added
+        batch.clear()
+
+    for row_number, row in enumerate(rows, 1):
+        if isinstance(row, dict):
+            title, author = text(row.get("title")), text(row.get("author"))
+            year, error = validate_book(title, author, row.get("year_published"))
+        elif row is NOT_JSON:
+            error = "Not valid JSON."
+        else:
+            error = "Not a book record."     # e.g. a JSON Lines row that is a list
+        if error:
+            report["invalid"] += 1
+            if len(report["errors"]) < MAX_ERRORS:
+                report["errors"].append(f"Row {row_number}: {error}")
+            continue
+        batch.append(make_book(title, author, text(row.get("genre")), year,
+                               text(row.get("isbn")), text(row.get("added_date")) or None))
+        if len(batch) >= batch_size:
+            commit()
+    if batch:
+        commit()
+    return report
+
+
+def export_books(repository, file, fmt):
+    """Write every book to an open text file; return how many were written."""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(file, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for book in repository.iter_books():
+            writer.writerow(book)
+            count += 1
+        return count
+    for book in repository.iter_books():
+        file.write(json.dumps(book) + "\n")
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export library books as CSV or JSON Lines.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help="a .csv file, or anything else for JSON Lines")
+    parser.add_argument("--backend", choices=sorted(BACKENDS),
+                        default=os.environ.get("LIBRARY_BACKEND", "json"))
+    parser.add_argument("--data", help="library file (default books_library.json or .db)")
+    args = parser.parse_args()
+
+    repository = open_repository(args.backend, args.data)
+    fmt = file_format(args.path)
+    if args.command == "import":
+        # utf-8-sig drops the byte order mark Excel puts at the start of a CSV
+        with open(args.path, newline="", encoding="utf-8-sig") as file:
+            report = import_books(repository, read_rows(file, fmt))
+        repository.flush()
+        print(f"Added {report['added']} books, skipped {report['skipped']} duplicate ISBNs, "
+              f"rejected {report['invalid']} invalid rows.")
+        for error in report["errors"]:
+            print("  " + error)
+    else:
+        with open(args.path, "w", newline="", encoding="utf-8") as file:
+            count = export_books(repository, file, fmt)
+        print(f"Exported {count} books to {args.path}.")
+
+
+if __name__ == "__main__":
+    main()
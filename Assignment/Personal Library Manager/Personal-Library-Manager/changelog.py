@@ -0,0 +1,48 @@
+"""A version number for the library and a short log of recent changes.
+
+Every change to the library gets the next version number, and the books it
+touched are logged with it.  A reader that last looked at version v can
+ask for changes_since(v) and get only the books added, changed or deleted
+after that, instead of reloading the whole library.  The log keeps the
+last CHANGE_LOG_SIZE entries.  A reader that has fallen further behind,
+or is older than a replace_all, gets None and must reload.
+"""
+from collections import deque
+
+CHANGE_LOG_SIZE = 1000
+
+
+class ChangeLog:
+    """Version counter plus (version, book id, book or None if deleted) entries."""
+
+    def __init__(self, size=CHANGE_LOG_SIZE):
+        self.version = 0
+        self.entries = deque(maxlen=size)
+        self.oldest = 0     # changes_since(v) can answer for any v >= oldest
+
+    def record(self, changed):
+        """Log one change: an iterable of (book id, book), with book None for a deletion."""
+        self.version += 1
+        for book_id, book in changed:
+            if len(self.entries) == self.entries.maxlen:
+                # readers older than the entry about to drop out can no longer catch up
+                self.oldest = self.entries[0][0]
+            self.entries.append((self.version, book_id, book))
+
+    def reset(self):
+        """Every book may have changed: readers from before now must reload."""
+        self.version += 1
+        self.entries.clear()
+        self.oldest = self.version
+
+    def changes_since(self, version):
+        """{book id: book, or None if deleted} for changes after version, or None to reload."""
+        if not self.oldest <= version <= self.version:
+            return None     # too old, or from before this log was started
+        recent = []
+        for entry in reversed(self.entries):
+            if entry[0] <= version:
+                break
+            recent.append(entry)
+        # oldest first, so a book changed twice ends up in its latest state
+        return {book_id: book for _, book_id, book in reversed(recent)}
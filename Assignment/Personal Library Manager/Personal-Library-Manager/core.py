@@ -0,0 +1,57 @@
+"""The library without the user interface.
+
+Opening the library and adding, editing and deleting books live here, not
+in main.py.  This module imports neither Streamlit nor pandas, so scripts,
+batch jobs and benchmarks/bench_library.py can use the same code as the
+app.  Instead of showing an error, each function returns its message, and
+main.py decides how to display it.  Searching and filtering are methods of
+the repository itself: search(), find(), genres() and stats().
+"""
+from library import BookRepository, DuplicateISBNError, make_book, validate_book
+
+BACKENDS = {"json": "books_library.json", "sqlite": "books_library.db"}  # backend -> default file
+
+
+def open_repository(backend="json", path=None):
+    """A BookRepository or SqliteRepository for path (default: BACKENDS[backend])."""
+    path = path or BACKENDS[backend]
+    if backend == "sqlite":
+        from sqlite_library import SqliteRepository
+        return SqliteRepository(path)
+    return BookRepository(path)
+
+
+def add_book(repository, title, author, genre, year_published, isbn=""):
+    """Validate and add a new book; return an error message, or None on success."""
+    year_published, error = validate_book(title, author, year_published)
+    if error:
+        return error
+    book = make_book(title, author, genre, year_published, isbn)
+    try:
+        repository.add(book)
+    except DuplicateISBNError:
+        return f"A book with ISBN {book['isbn']} is already in the library."
+    return None
+
+
+def update_book(repository, book_id, title, author, genre, year_published, isbn=""):
+    """Validate and save new details for a book; return an error message, or None on success."""
+    year_published, error = validate_book(title, author, year_published)
+    if error:
+        return error
+    try:
+        found = repository.update(book_id, {
+            "title": title.strip(),
+            "author": author.strip(),
+            "genre": (genre or "").strip(),
+            "year_published": year_published,
+            "isbn": (isbn or "").strip()
+        })
+    except DuplicateISBNError:
+        return f"A book with ISBN {isbn.strip()} is already in the library."
+    return None if found else "Book not found for updating."
+
+
+def delete_book(repository, book_id):
+    """Delete a book; return an error message, or None on success."""
+    return None if repository.delete(book_id) else "Book not found for deletion."
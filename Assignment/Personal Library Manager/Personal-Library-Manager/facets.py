@@ -0,0 +1,53 @@
+"""Book counts per genre, author and decade, behind the filters and statistics.
+
+Counting over every book on each rerun costs O(#books).  Facets instead
+keeps the counts and adjusts them by one as each book is added, changed or
+removed, so the genre list and the statistics panel only cost as much as
+the number of distinct genres, authors and decades.
+"""
+from collections import Counter
+
+
+def decade(book):
+    """1965 -> 1960; None when the year is unknown (0 or missing)."""
+    year = book.get("year_published") or 0
+    return year // 10 * 10 if isinstance(year, int) and year > 0 else None
+
+
+FACETS = {  # facet -> the book's value for it, or None to leave the book out
+    "genre": lambda book: book.get("genre") or None,
+    "author": lambda book: book.get("author") or None,
+    "decade": decade,
+}
+
+
+class Facets:
+    """Facet -> value -> number of books, updated as books change."""
+
+    def __init__(self, books=()):
+        self.total = 0
+        self.counts = {facet: Counter() for facet in FACETS}
+        for book in books:
+            self.add(book)
+
+    def add(self, book, change=1):
+        self.total += change
+        for facet, value_of in FACETS.items():
+            value = value_of(book)
+            if value is None:
+                continue
+            counts = self.counts[facet]
+            counts[value] += change
+            if counts[value] <= 0:
+                del counts[value]   # so len() and the genre list only see values still in use
+
+    def remove(self, book):
+        self.add(book, -1)
+
+    def values(self, facet):
+        """The values of a facet that some book has, sorted."""
+        return sorted(self.counts[facet])
+
+    def snapshot(self):
+        """A copy of the counts that is safe to read while books keep changing."""
+        return {"books": self.total, **{facet: dict(counts) for facet, counts in self.counts.items()}}
@@ -0,0 +1,74 @@
+"""Trigram similarity between words, for searches with typos in them.
+
+A word's trigrams are its three-letter slices, padded so that the start and
+end of the word count too: "tolkien" gives "  t", " to", "tol", ..., "en ".
+Two spellings of a word share most of their trigrams, so a typo like
+"tolkein" is still close to "tolkien": similarity is shared trigrams over
+all trigrams of the two words (Jaccard).
+
+TrigramIndex maps each trigram to the indexed words that contain it.  The
+words close to a query word are then found by counting hits in a few
+posting lists, instead of comparing against every word.  The index holds
+distinct words, not books, so it grows with the vocabulary rather than with
+the size of the library.
+"""
+import heapq
+from collections import Counter
+
+MIN_SIMILARITY = 0.3    # below this a word is not considered a misspelling of another
+MAX_WORDS = 8           # closest indexed words kept for each query word
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Trigram -> set of words, updated as words come and go."""
+
+    def __init__(self, words=()):
+        self.postings = {}
+        self.sizes = {}     # word -> how many trigrams it has
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        if word in self.sizes:
+            return
+        grams = trigrams(word)
+        self.sizes[word] = len(grams)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(word)
+
+    def remove(self, word):
+        if self.sizes.pop(word, None) is None:
+            return
+        for gram in trigrams(word):
+            words = self.postings[gram]
+            words.discard(word)
+            if not words:
+                del self.postings[gram]
+
+    def similar(self, term, limit=MAX_WORDS, min_similarity=MIN_SIMILARITY):
+        """Up to limit (word, similarity) pairs for the words closest to term, closest first."""
+        # A word sharing `count` of the term's trigrams has similarity at most
+        # count / len(grams).  That bound lets both loops below stop early.
+        grams = sorted(trigrams(term), key=lambda gram: len(self.postings.get(gram, ())))
+        shared = Counter()
+        for i, gram in enumerate(grams):
+            words = self.postings.get(gram, ())
+            if (len(grams) - i) / len(grams) < min_similarity:
+                # a word not met in the rarer trigrams can't get close enough; only count known ones
+                words = shared.keys() & words
+            shared.update(words)
+        best = []   # heap of the limit closest (similarity, word) so far
+        for word, count in shared.most_common():
+            if count / len(grams) < max(min_similarity, best[0][0] if len(best) == limit else 0):
+                break
+            similarity = count / (len(grams) + self.sizes[word] - count)
+            if similarity >= min_similarity:
+                heapq.heappush(best, (similarity, word))
+                if len(best) > limit:
+                    heapq.heappop(best)
+        return [(word, similarity) for similarity, word in sorted(best, reverse=True)]
@@ -0,0 +1,305 @@
+"""In-memory book repository with write-behind saving.
+
+BookRepository keeps every book in a dict keyed by id, along with the
+indexes built from the books (search, facet counts, sort orders) and a log
+of recent changes, all updated in place as books change.  The JSON file is
+saved by a background thread shortly after a change, through a temp file
+and a rename, and carries a schema version so older files are migrated
+once when opened.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from changelog import ChangeLog
+from facets import Facets
+from ordering import SortedIndexes
+from search import FUZZY_LIMIT, BookIndex
+
+FLUSH_DELAY = 0.5   # seconds to let more changes pile up before saving
+SCHEMA_VERSION = 2  # 1: a bare list of books; 2: {"schema_version": 2, "books": [...]}, years are ints
+
+
+class DuplicateISBNError(ValueError):
+    """Another book already has this ISBN."""
+
+
+class NewerLibraryError(ValueError):
+    """The library file has a schema version newer than SCHEMA_VERSION."""
+
+
+def validate_book(title, author, year_published):
+    """Check the required fields; return (year as int, None) or (None, error message)."""
+    if not title or not author:
+        return None, "Title and Author are required fields."
+    try:
+        year_published = int(year_published)
+    except (TypeError, ValueError):
+        return None, "Year Published must be a number."
+    if year_published > datetime.now().year or year_published < 0:
+        return None, f"Please enter a valid year (e.g., up to {datetime.now().year})."
+    return year_published, None
+
+
+def make_book(title, author, genre, year_published, isbn="", added_date=None):
+    """A new book dict with a fresh id; year_published must already be validated."""
+    return {
+        "id": str(uuid.uuid4()),
+        "title": title.strip(),
+        "author": author.strip(),
+        "genre": (genre or "").strip(),
+        "year_published": year_published,
+        "isbn": (isbn or "").strip(),
+        "added_date": added_date or datetime.now().isoformat()
+    }
+
+
+def migrate_library(data):
+    """Bring the contents of a library file up to SCHEMA_VERSION.
+
+    Returns (books, how many books had to be changed).  Raises
+    NewerLibraryError for a file from a newer version, rather than
+    rewriting it in a format that would lose what that version added.
+    """
+    if isinstance(data, dict):
+        version, books = data.get("schema_version", 1), data.get("books", [])
+    else:
+        version, books = 1, data    # version 1 files are a bare list of books
+    if version > SCHEMA_VERSION:
+        raise NewerLibraryError(f"schema version {version} is newer than {SCHEMA_VERSION}")
+    touched = 0
+    if version < 2:
+        # version 1 could hold year_published as a string
+        for book in books:
+            if isinstance(book.get('year_published'), str):
+                try:
+                    book['year_published'] = int(book['year_published'])
+                except ValueError:
+                    book['year_published'] = 0 # Default or handle error
+                touched += 1
+    return books, touched
+
+
+def decode_library(path):
+    """The parsed contents of a library file, or None if it is missing or broken."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def is_current(data):
+    return isinstance(data, dict) and data.get("schema_version") == SCHEMA_VERSION
+
+
+def load_library(path, save_upgrade=True):
+    """Read the books from a JSON file, migrating an older file once.
+
+    Returns (books, touched).  A missing or broken file gives ([], None).  A
+    current file is used exactly as decoded, and touched is None.  An older
+    one is migrated, and touched is how many books had to change; it is
+    saved back only if save_upgrade is true.
+    """
+    data = decode_library(path)
+    if data is None:
+        return [], None
+    if is_current(data):
+        return data["books"], None
+    books, touched = migrate_library(data)
+    if save_upgrade:
+        write_library(path, books)
+    return books, touched
+
+
+def write_library(path, books_data):
+    """Write books to path atomically: temp file, fsync, rename."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"schema_version": SCHEMA_VERSION, "books": books_data}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class BookRepository:
+    """All books in memory, keyed by id, saved to a JSON file in the background."""
+
+    def __init__(self, path, flush_delay=FLUSH_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+        books, self.upgraded = load_library(path)    # books fixed by a schema migration, or None
+        self.books = {book["id"]: book for book in books}
+        self.index = BookIndex(self.books.values())
+        self.facets = Facets(self.books.values())
+        self.order = SortedIndexes(self.books.values())
+        self.isbns = {book["isbn"]: book["id"] for book in self.books.values() if book.get("isbn")}
+        self._lock = threading.Lock()       # guards self.books
+        self._save_lock = threading.Lock()  # one save at a time
+        self._dirty = threading.Event()
+        self.changes = ChangeLog()
+        threading.Thread(target=self._flush_loop, name="library-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    @property
+    def version(self):
+        """Goes up by one on every change, so caches know when to rebuild."""
+        return self.changes.version
+
+    def changes_since(self, version):
+        """(current version, {book id: book or None} changed since version, or None to reload)."""
+        with self._lock:
+            return self.changes.version, self.changes.changes_since(version)
+
+    def all(self):
+        """Return the books as a list, in the order they were added."""
+        with self._lock:
+            return list(self.books.values())
+
+    def get(self, book_id):
+        return self.books.get(book_id)
+
+    def find(self, genre=None, year_from=None, year_to=None):
+        """Books in a genre and/or year range, oldest first."""
+        with self._lock:
+            books = [self.books[book_id] for _, book_id in self.order.year_range(year_from, year_to)]
+        return [book for book in books if genre is None or book.get("genre") == genre]
+
+    def ordered_ids(self, sort_by="added_date", descending=False, year_from=None, year_to=None):
+        """Book ids sorted by sort_by (a key of ordering.SORT_KEYS), optionally in a year range."""
+        with self._lock:
+            return self.order.ids(sort_by, descending, year_from, year_to)
+
+    def year_span(self):
+        """(first, last) known publication year, or None if no book has one."""
+        with self._lock:
+            return self.order.year_span()
+
+    def genres(self):
+        """Distinct non-empty genres, sorted."""
+        with self._lock:
+            return self.facets.values("genre")
+
+    def stats(self):
+        """Book counts in total and per genre, author and decade."""
+        with self._lock:
+            return self.facets.snapshot()
+
+    def _check_isbn(self, isbn, book_id):
+        if isbn and self.isbns.get(isbn, book_id) != book_id:
+            raise DuplicateISBNError(isbn)
+
+    def search(self, query):
+        """Books matching every word of query, best match first, then by title."""
+        with self._lock:
+            scores = self.index.search(query)
+            found = [self.books[book_id] for book_id in scores]
+        return sorted(found, key=lambda book: (-scores[book["id"]], book.get("title", "").lower()))
+
+    def fuzzy_search(self, query, limit=FUZZY_LIMIT):
+        """Up to limit books with words close to every word of query, closest first."""
+        with self._lock:
+            scores = dict(self.index.fuzzy_search(query, limit))
+            found = [self.books[book_id] for book_id in scores]
+        return sorted(found, key=lambda book: (-scores[book["id"]], book.get("title", "").lower()))
+
+    def add(self, book):
+        with self._lock:
+            self._check_isbn(book.get("isbn"), book["id"])
+            if book.get("isbn"):
+                self.isbns[book["isbn"]] = book["id"]
+            self.books[book["id"]] = book
+            self.index.add(book)
+            self.facets.add(book)
+            self.order.add(book)
+            self.changes.record([(book["id"], book)])
+            self._dirty.set()
+
+    def add_many(self, books):
+        """Add books in one go, skipping any whose ISBN is taken; return how many were added."""
+        added = []
+        with self._lock:
+            for book in books:
+                if book.get("isbn") and book["isbn"] in self.isbns:
+                    continue
+                if book.get("isbn"):
+                    self.isbns[book["isbn"]] = book["id"]
+                self.books[book["id"]] = book
+                self.index.add(book)
+                self.facets.add(book)
+                self.order.add(book)
+                added.append((book["id"], book))
+            if added:
+                self.changes.record(added)
+                self._dirty.set()   # the whole batch goes out in one background save
+        return len(added)
+
+    def iter_books(self):
+        """Yield every book; the JSON backend already has them all in memory."""
+        yield from self.all()
+
+    def update(self, book_id, changes):
+        """Apply changes to a book; return False if there is no such book."""
+        with self._lock:
+            if book_id not in self.books:
+                return False
+            # a new dict, so lists already handed out by all() never change under a reader
+            old = self.books[book_id]
+            new = {**old, **changes}
+            self._check_isbn(new.get("isbn"), book_id)
+            self.isbns.pop(old.get("isbn"), None)
+            if new.get("isbn"):
+                self.isbns[new["isbn"]] = book_id
+            self.books[book_id] = new
+            self.index.remove(old)
+            self.index.add(new)
+            self.facets.remove(old)
+            self.facets.add(new)
+            self.order.remove(old)
+            self.order.add(new)
+            self.changes.record([(book_id, new)])
+            self._dirty.set()
+            return True
+
+    def delete(self, book_id):
+        """Remove a book; return False if there is no such book."""
+        with self._lock:
+            book = self.books.pop(book_id, None)
+            if book is None:
+                return False
+            self.index.remove(book)
+            self.facets.remove(book)
+            self.order.remove(book)
+            self.isbns.pop(book.get("isbn"), None)
+            self.changes.record([(book_id, None)])
+            self._dirty.set()
+            return True
+
+    def replace_all(self, books_data):
+        with self._lock:
+            self.books = {book["id"]: book for book in books_data}
+            self.index = BookIndex(self.books.values())
+            self.facets = Facets(self.books.values())
+            self.order = SortedIndexes(self.books.values())
+            self.isbns = {book["isbn"]: book["id"] for book in self.books.values() if book.get("isbn")}
+            self.changes.reset()
+            self._dirty.set()
+
+    def _flush_loop(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(self.flush_delay)
+            self.flush()
+
+    def flush(self):
+        """Save the books now if anything changed since the last save."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty.is_set():
+                    return
+                self._dirty.clear()
+                books_data = list(self.books.values())
+            write_library(self.path, books_data)
@@ -1,114 +1,139 @@
 import streamlit as st
-import json
-import uuid
+import io
+import os
 import pandas as pd
+import threading
 from datetime import datetime
+import core
+from bulk import export_books, import_books, read_rows
+from library import SCHEMA_VERSION, NewerLibraryError
 
 # --- Configuration ---
-DATA_FILE = "books_library.json"
+BACKEND = os.environ.get("LIBRARY_BACKEND", "json")    # "json" or "sqlite"
+DATA_FILE = core.BACKENDS[BACKEND]
+PAGE_SIZES = [10, 25, 50, 100]
+SORT_OPTIONS = {    # label -> (repository sort key, newest/highest first)
+    "Date added (oldest first)": ("added_date", False),
+    "Date added (newest first)": ("added_date", True),
+    "Title": ("title", False),
+    "Author": ("author", False),
+    "Year (newest first)": ("year_published", True),
+    "Year (oldest first)": ("year_published", False),
+}
+CATALOGUE_COLUMNS = ["id", "title", "author", "genre", "year_published", "isbn", "added_date"]
+CATEGORY_COLUMNS = ["author", "genre"]
+TOP_FACETS = 10     # genres/authors listed in the statistics panel
+DISPLAY_COLUMNS = {"title": "Title", "author": "Author", "genre": "Genre", "year_published": "Year", "isbn": "ISBN"}
 
 # --- Data Handling Functions ---
+@st.cache_resource
+def get_repository():
+    """One copy of the library, shared by every session."""
+    return core.open_repository(BACKEND, DATA_FILE)
+
+@st.cache_resource
+def get_upgrade_report():
+    """How many books the schema upgrade on opening fixed (None if none ran), and whether a session has said so."""
+    return {"upgraded": getattr(get_repository(), "upgraded", None), "shown": False}
+
 def load_books():
-    """Loads books from the JSON data file."""
-    try:
-        with open(DATA_FILE, 'r') as f:
-            books_data = json.load(f)
-            # Ensure year_published is int, handle potential string from older data
-            for book in books_data:
-                if 'year_published' in book and isinstance(book['year_published'], str):
-                    try:
-                        book['year_published'] = int(book['year_published'])
-                    except ValueError:
-                        book['year_published'] = 0 # Default or handle error
-            return books_data
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    """Returns the books from the shared in-memory repository."""
+    return get_repository().all()
 
 def save_books(books_data):
-    """Saves the list of books to the JSON data file."""
-    with open(DATA_FILE, 'w') as f:
-        json.dump(books_data, f, indent=4)
-
-def generate_id():
-    """Generates a unique ID for a book."""
-    return str(uuid.uuid4())
+    """Replaces every book; the file is written in the background."""
+    get_repository().replace_all(books_data)
+
+def make_catalogue(books):
+    """Books as a typed DataFrame indexed by id."""
+    df = pd.DataFrame(books, columns=CATALOGUE_COLUMNS)
+    df["year_published"] = pd.to_numeric(df["year_published"], errors="coerce").fillna(0).astype("int32")
+    for column in CATEGORY_COLUMNS:
+        # repeated strings stored once, and compared as small ints
+        df[column] = df[column].fillna("").astype("category")
+    return df.set_index("id", drop=False)
+
+def apply_changes(catalogue, changes):
+    """A new catalogue with changes ({book id: book, or None if deleted}) applied.
+
+    Changed books keep their row, new ones go at the end.  The frame shared
+    by other sessions is left as it is, since they may be reading it.
+    """
+    changed = make_catalogue([book for book in changes.values() if book is not None])
+    catalogue = catalogue.drop([book_id for book_id, book in changes.items() if book is None], errors="ignore")
+    if changed.empty:
+        return catalogue
+    for column in CATEGORY_COLUMNS:
+        categories = catalogue[column].cat.categories.union(changed[column].cat.categories)
+        catalogue[column] = catalogue[column].cat.set_categories(categories)
+        changed[column] = changed[column].cat.set_categories(categories)
+    known = catalogue.index.get_indexer(changed.index) >= 0
+    catalogue.loc[changed.index[known]] = changed[known]
+    return pd.concat([catalogue, changed[~known]])
+
+@st.cache_resource
+def get_catalogue_state():
+    """The catalogue every session shares, the version it is at, and a lock for updating it."""
+    return {"catalogue": None, "version": None, "repository": None, "lock": threading.Lock()}
+
+def get_catalogue():
+    """(version, the library as a typed DataFrame), brought up to date with the change log.
+
+    Only the books changed since the catalogue was last brought up to date
+    are applied to it, once for all sessions.  It is rebuilt from every book
+    only when the change log can't say what changed.
+    """
+    repository = get_repository()
+    state = get_catalogue_state()
+    with state["lock"]:
+        current = state["repository"] is repository
+        version, changes = repository.changes_since(state["version"] if current else -1)
+        if changes is None or not current:
+            state["catalogue"] = make_catalogue(repository.all())
+            state["repository"] = repository
+        elif changes:
+            state["catalogue"] = apply_changes(state["catalogue"], changes)
+        state["version"] = version
+        return version, state["catalogue"]
+
+@st.cache_resource(max_entries=4)
+def get_order(version, sort_by, newest_first, year_range):
+    """Book ids in sort order, within year_range if given; rebuilt only when version changes.
+
+    The repository keeps the books sorted by each sort key, so this is a
+    slice of a list that is already in order, not a sort.
+    """
+    year_from, year_to = year_range or (None, None)
+    return pd.Index(get_repository().ordered_ids(sort_by, newest_first, year_from, year_to))
 
 # --- Core Library Functions ---
+# The work is done by core.py, which has no Streamlit in it; these show the outcome.
 def add_book(title, author, genre, year_published, isbn=""):
     """Adds a new book to the library."""
-    if not title or not author:
-        st.error("Title and Author are required fields.")
-        return False
-
-    try:
-        year_published = int(year_published)
-        if year_published > datetime.now().year or year_published < 0:
-            st.error(f"Please enter a valid year (e.g., up to {datetime.now().year}).")
-            return False
-    except ValueError:
-        st.error("Year Published must be a number.")
+    error = core.add_book(get_repository(), title, author, genre, year_published, isbn)
+    if error:
+        st.error(error)
         return False
-
-    books = load_books()
-    new_book = {
-        "id": generate_id(),
-        "title": title.strip(),
-        "author": author.strip(),
-        "genre": genre.strip(),
-        "year_published": year_published,
-        "isbn": isbn.strip(),
-        "added_date": datetime.now().isoformat()
-    }
-    books.append(new_book)
-    save_books(books)
     st.success(f"Book '{title}' added successfully!")
     return True
 
 def update_book(book_id, title, author, genre, year_published, isbn=""):
     """Updates an existing book's details."""
-    if not title or not author:
-        st.error("Title and Author are required fields.")
-        return False
-    try:
-        year_published = int(year_published)
-        if year_published > datetime.now().year or year_published < 0:
-            st.error(f"Please enter a valid year (e.g., up to {datetime.now().year}).")
-            return False
-    except ValueError:
-        st.error("Year Published must be a number.")
-        return False
-
-    books = load_books()
-    book_found = False
-    for book in books:
-        if book["id"] == book_id:
-            book["title"] = title.strip()
-            book["author"] = author.strip()
-            book["genre"] = genre.strip()
-            book["year_published"] = year_published
-            book["isbn"] = isbn.strip()
-            book_found = True
-            break
-    if book_found:
-        save_books(books)
-        st.success(f"Book '{title}' updated successfully!")
-        return True
-    else:
-        st.error("Book not found for updating.")
+    error = core.update_book(get_repository(), book_id, title, author, genre, year_published, isbn)
+    if error:
+        st.error(error)
         return False
+    st.success(f"Book '{title}' updated successfully!")
+    return True
 
 def delete_book(book_id):
     """Deletes a book from the library."""
-    books = load_books()
-    initial_len = len(books)
-    books = [book for book in books if book["id"] != book_id]
-    if len(books) < initial_len:
-        save_books(books)
-        st.success("Book deleted successfully!")
-        return True
-    else:
-        st.error("Book not found for deletion.")
+    error = core.delete_book(get_repository(), book_id)
+    if error:
+        st.error(error)
         return False
+    st.success("Book deleted successfully!")
+    return True
 
 # --- Streamlit UI ---
 st.set_page_config(page_title="Personal Library Manager", layout="wide", page_icon="📚")
@@ -116,16 +141,22 @@ st.set_page_config(page_title="Personal Library Manager", layout="wide", page_ic
 st.title("📚 Personal Library Manager")
 st.markdown("Manage your personal book collection with ease.")
 
-# --- Load books initially ---
-if 'books_data' not in st.session_state:
-    st.session_state.books_data = load_books()
+try:
+    upgrade_report = get_upgrade_report()
+except NewerLibraryError as e:
+    st.error(f"`{DATA_FILE}` was written by a newer version of this app ({e}). Update the app to open it.")
+    st.stop()
+if upgrade_report["upgraded"] is not None and not upgrade_report["shown"]:
+    upgrade_report["shown"] = True # Once, in whichever session opened the library
+    st.toast(f"Upgraded `{DATA_FILE}` to schema version {SCHEMA_VERSION}: {upgrade_report['upgraded']} books fixed.")
+
 if 'editing_book_id' not in st.session_state:
     st.session_state.editing_book_id = None
 
 
 # --- Sidebar for Actions (Add/Edit) ---
 st.sidebar.header("Actions")
-action = st.sidebar.radio("Choose an action:", ["View Books", "Add New Book"], key="action_radio")
+action = st.sidebar.radio("Choose an action:", ["View Books", "Add New Book", "Import / Export"], key="action_radio")
 
 if st.session_state.editing_book_id:
     action = "Edit Book" # Force action to Edit if an edit is in progress
@@ -137,11 +168,11 @@ if action == "Add New Book" or action == "Edit Book":
 
     book_to_edit = None
     if action == "Edit Book" and st.session_state.editing_book_id:
-        book_to_edit = next((book for book in st.session_state.books_data if book["id"] == st.session_state.editing_book_id), None)
+        book_to_edit = get_repository().get(st.session_state.editing_book_id)
         if not book_to_edit:
             st.sidebar.error("Error: Could not find the book to edit.")
             st.session_state.editing_book_id = None # Reset
-            st.experimental_rerun()
+            st.rerun()
 
 
     default_title = book_to_edit['title'] if book_to_edit else ""
@@ -163,72 +194,146 @@ if action == "Add New Book" or action == "Edit Book":
         if submitted:
             if action == "Add New Book":
                 if add_book(title, author, genre, year, isbn):
-                    st.session_state.books_data = load_books() # Refresh data
                     st.rerun() # Rerun to clear form and update view
             elif action == "Edit Book" and book_to_edit:
                 if update_book(book_to_edit["id"], title, author, genre, year, isbn):
-                    st.session_state.books_data = load_books() # Refresh data
                     st.session_state.editing_book_id = None # Clear editing state
-                    st.experimental_rerun() # Rerun to reflect changes and clear form
+                    st.rerun() # Rerun to reflect changes and clear form
 
     if action == "Edit Book":
         if st.sidebar.button("Cancel Edit"):
             st.session_state.editing_book_id = None
-            st.experimental_rerun()
+            st.rerun()
+
+# --- Import / Export ---
+if action == "Import / Export":
+    st.sidebar.subheader("📦 Import / Export")
+    uploaded = st.sidebar.file_uploader("Import books from CSV or JSON Lines", type=["csv", "jsonl"])
+    if uploaded is not None and st.sidebar.button("Import"):
+        # read the upload row by row instead of decoding it into one big string
+        fmt = "csv" if uploaded.name.lower().endswith(".csv") else "jsonl"
+        rows = read_rows(io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline=""), fmt)
+        try:
+            report = import_books(get_repository(), rows)
+        except (ValueError, UnicodeDecodeError) as e:
+            st.sidebar.error(f"Could not read the file: {e}")
+        else:
+            st.sidebar.success(f"Added {report['added']} books. Skipped {report['skipped']} duplicate ISBNs, "
+                               f"rejected {report['invalid']} invalid rows.")
+            for error in report["errors"]:
+                st.sidebar.warning(error)
+
+    export_format = st.sidebar.selectbox("Export format:", ["csv", "jsonl"])
+    # The whole library is only written out when asked for, not on every rerun
+    if st.sidebar.button("Prepare export"):
+        export_file = io.StringIO()
+        count = export_books(get_repository(), export_file, export_format)
+        st.sidebar.download_button(f"Download {count} books", export_file.getvalue(),
+                                   file_name=f"books_library.{export_format}",
+                                   mime="text/csv" if export_format == "csv" else "application/x-ndjson",
+                                   on_click="ignore") # Keep the button until the download is done
 
 # --- View Books Section ---
 if action == "View Books":
     st.header("My Book Collection")
 
-    if not st.session_state.books_data:
+    # --- Catch up with changes made by this and other sessions ---
+    version, catalogue = get_catalogue()
+    if catalogue.empty:
         st.info("Your library is empty. Add some books to get started!")
     else:
+        # --- Statistics ---
+        # read from counts the repository keeps up to date; no pass over the books
+        stats = get_repository().stats()
+        with st.expander("📊 Library Statistics"):
+            stat_col1, stat_col2, stat_col3 = st.columns(3)
+            stat_col1.metric("Books", stats["books"])
+            stat_col2.metric("Authors", len(stats["author"]))
+            stat_col3.metric("Genres", len(stats["genre"]))
+            if stats["decade"]:
+                st.markdown("**Books per decade**")
+                decades = pd.Series(stats["decade"]).sort_index()
+                decades.index = [f"{decade}s" for decade in decades.index]
+                st.bar_chart(decades)
+            top_col1, top_col2 = st.columns(2)
+            for column, facet, label in ((top_col1, "genre", "Genre"), (top_col2, "author", "Author")):
+                top = sorted(stats[facet].items(), key=lambda item: (-item[1], item[0]))[:TOP_FACETS]
+                if top:
+                    column.markdown(f"**Top {label.lower()}s**")
+                    column.dataframe(pd.DataFrame(top, columns=[label, "Books"]), hide_index=True)
+
         # --- Search and Filter ---
-        search_col1, search_col2 = st.columns([3,1])
+        search_col1, search_col2, search_col3 = st.columns([3,1,2])
         with search_col1:
             search_term = st.text_input("Search by Title, Author, or Genre:", placeholder="Enter keyword...").lower()
         with search_col2:
-            # Create a list of unique genres for filtering
-            all_genres = sorted(list(set(book.get('genre', 'N/A') for book in st.session_state.books_data if book.get('genre'))))
+            # Kept by the repository as books change, so this is not a pass over every book
+            all_genres = get_repository().genres()
             if not all_genres: # Handle case with no genres yet
                 selected_genre_filter = st.selectbox("Filter by Genre:", ["All"], disabled=True)
             else:
                 selected_genre_filter = st.selectbox("Filter by Genre:", ["All"] + all_genres)
-
-
-        filtered_books = st.session_state.books_data
+        with search_col3:
+            year_span = get_repository().year_span()
+            year_range = None
+            if year_span and year_span[0] < year_span[1]:
+                first_year, last_year = year_span
+                low, high = st.session_state.get("year_range", (first_year, last_year))
+                if low < first_year or high > last_year:
+                    del st.session_state["year_range"] # Library changed; start from the full range
+                year_range = st.slider("Year Published:", first_year, last_year, (first_year, last_year), key="year_range")
+                if year_range == (first_year, last_year):
+                    year_range = None # Full range: keep books with an unknown year too
+
+        # Every filter is an index lookup or a boolean mask over the cached frame; no per-book Python loop
+        filtered = catalogue
+        if year_range:
+            # two bisects in the repository's year order, then the rows for those ids
+            filtered = filtered.reindex(get_order(version, "year_published", False, year_range)).dropna(subset=["id"])
         if search_term:
-            filtered_books = [
-                book for book in filtered_books
-                if search_term in book.get('title', '').lower() or \
-                   search_term in book.get('author', '').lower() or \
-                   search_term in book.get('genre', '').lower()
-            ]
+            # the word index finds and ranks the matches; the frame is reordered to them
+            found = get_repository().search(search_term)
+            if not found:
+                # nothing matches as typed; try the closest spellings instead
+                found = get_repository().fuzzy_search(search_term)
+                if found:
+                    st.caption(f"No exact matches for '{search_term}'. Showing the closest matches.")
+            ranked_ids = [book["id"] for book in found]
+            filtered = filtered.loc[[book_id for book_id in ranked_ids if book_id in filtered.index]]
         if selected_genre_filter != "All":
-            filtered_books = [book for book in filtered_books if book.get('genre', '') == selected_genre_filter]
+            filtered = filtered[filtered["genre"] == selected_genre_filter]
 
-        if not filtered_books and (search_term or selected_genre_filter != "All"):
+        if filtered.empty and (search_term or selected_genre_filter != "All" or year_range):
             st.warning("No books match your search/filter criteria.")
-        elif not filtered_books:
+        elif filtered.empty:
              st.info("Your library is empty or no books match the current filter.")
         else:
             # Display books using Pandas DataFrame for better table formatting
-            # Select and reorder columns for display
-            display_data = []
-            for book in filtered_books:
-                display_data.append({
-                    "Title": book.get("title"),
-                    "Author": book.get("author"),
-                    "Genre": book.get("genre"),
-                    "Year": book.get("year_published"),
-                    "ISBN": book.get("isbn", "N/A")
-                })
-            
-            df = pd.DataFrame(display_data)
-            st.dataframe(df, use_container_width=True)
+            df = filtered[list(DISPLAY_COLUMNS)].rename(columns=DISPLAY_COLUMNS)
+            st.dataframe(df, use_container_width=True, hide_index=True)
 
             st.subheader("Manage Books")
-            for i, book in enumerate(filtered_books): # Iterate over filtered books to get correct indices
+            # Only one page of rows gets widgets; the rest of the list is never rendered
+            page_col1, page_col2, page_col3 = st.columns(3)
+            with page_col1:
+                page_size = st.selectbox("Books per page:", PAGE_SIZES, index=1, key="page_size")
+            with page_col2:
+                sort_label = st.selectbox("Sort by:", list(SORT_OPTIONS), key="sort_by")
+            page_count = (len(filtered) + page_size - 1) // page_size
+            if st.session_state.get("page_number", 1) > page_count:
+                st.session_state.page_number = page_count # List got shorter since last rerun
+            with page_col3:
+                page_number = st.number_input("Page:", min_value=1, max_value=page_count, step=1, key="page_number")
+
+            sort_by, newest_first = SORT_OPTIONS[sort_label]
+            order = get_order(version, sort_by, newest_first, year_range)
+            if search_term or selected_genre_filter != "All":
+                order = order[order.isin(filtered.index)] # Keep the already-sorted ids that passed the filters
+            start = (page_number - 1) * page_size
+            page_books = filtered.reindex(order[start:start + page_size]).dropna(subset=["id"]).to_dict("records")
+            st.caption(f"Showing {start + 1}–{start + len(page_books)} of {len(filtered)} books")
+
+            for i, book in enumerate(page_books):
                 cols = st.columns([4, 1, 1]) # Title | Edit | Delete
                 full_title_author = f"{book.get('title', 'N/A')} by {book.get('author', 'N/A')}"
                 
@@ -239,14 +344,13 @@ if action == "View Books":
                 edit_button_key = f"edit_{book['id']}"
                 if cols[1].button("✏️ Edit", key=edit_button_key, help=f"Edit '{book.get('title')}'"):
                     st.session_state.editing_book_id = book['id']
-                    st.experimental_rerun() # Rerun to switch to edit mode
+                    st.rerun() # Rerun to switch to edit mode
 
                 delete_button_key = f"delete_{book['id']}"
                 if cols[2].button("🗑️ Delete", key=delete_button_key, help=f"Delete '{book.get('title')}'"):
                     if delete_book(book['id']):
-                        st.session_state.books_data = load_books() # Refresh
-                        st.experimental_rerun() # Rerun to update view
-                if i < len(filtered_books) -1: # Add a divider for all but the last book
+                        st.rerun() # Rerun to update view
+                if i < len(page_books) -1: # Add a divider for all but the last book
                     st.divider()
 
 
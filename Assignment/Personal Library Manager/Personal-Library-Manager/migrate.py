@@ -0,0 +1,35 @@
+"""Copy a JSON library into an SQLite one.
+
+Usage: python migrate.py [books_library.json] [books_library.db]
+
+Books whose id or ISBN is already in the database are skipped, so running
+it twice does no harm.  Start the app with LIBRARY_BACKEND=sqlite afterwards.
+"""
+import sys
+from library import SCHEMA_VERSION, NewerLibraryError, load_library
+from sqlite_library import DB_FILE, SqliteRepository
+
+
+def migrate(json_path, db_path):
+    """Import every book from json_path.
+
+    Returns (books read, books added, books fixed while reading an older
+    json_path or None if it was already current).  json_path itself is
+    left as it is.
+    """
+    books, upgraded = load_library(json_path, save_upgrade=False)
+    return len(books), SqliteRepository(db_path).import_books(books), upgraded
+
+
+if __name__ == "__main__":
+    json_path = sys.argv[1] if len(sys.argv) > 1 else "books_library.json"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else DB_FILE
+    try:
+        read, added, upgraded = migrate(json_path, db_path)
+    except NewerLibraryError as e:
+        sys.exit(f"{json_path} was written by a newer version of this app ({e}).")
+    if upgraded is not None:
+        print(f"Read {json_path} as schema version {SCHEMA_VERSION} ({upgraded} books fixed on the way;"
+              " the file itself is unchanged).")
+    print(f"Read {read} books from {json_path}, added {added} to {db_path}"
+          f" ({read - added} already there or duplicate ISBN).")
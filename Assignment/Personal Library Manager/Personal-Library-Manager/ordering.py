@@ -0,0 +1,56 @@
+"""Books kept in order by year, title, author and date added.
+
+For each sort key there is a sorted list of (key value, book id), updated
+by insort/remove as books change.  Listing the library in any of these
+orders is then a walk down a list that is already sorted, and a year range
+is two bisects and a slice, instead of a sort of every book on each rerun.
+"""
+import bisect
+
+SORT_KEYS = {   # sort key -> the value a book is ordered by
+    "year_published": lambda book: book.get("year_published") or 0,
+    "title": lambda book: (book.get("title") or "").lower(),
+    "author": lambda book: (book.get("author") or "").lower(),
+    "added_date": lambda book: book.get("added_date") or "",
+}
+
+
+class SortedIndexes:
+    """Sort key -> sorted list of (value, book id), updated as books change."""
+
+    def __init__(self, books=()):
+        self.entries = {key: sorted((value_of(book), book["id"]) for book in books)
+                        for key, value_of in SORT_KEYS.items()}
+
+    def add(self, book):
+        for key, value_of in SORT_KEYS.items():
+            bisect.insort(self.entries[key], (value_of(book), book["id"]))
+
+    def remove(self, book):
+        for key, value_of in SORT_KEYS.items():
+            entries = self.entries[key]
+            del entries[bisect.bisect_left(entries, (value_of(book), book["id"]))]
+
+    def year_range(self, year_from=None, year_to=None):
+        """The (year, book id) entries with year_from <= year <= year_to, oldest first."""
+        years = self.entries["year_published"]
+        start = 0 if year_from is None else bisect.bisect_left(years, (year_from,))
+        end = len(years) if year_to is None else bisect.bisect_left(years, (year_to + 1,))
+        return years[start:end]
+
+    def year_span(self):
+        """(first, last) known year, or None if no book has one; unknown years are 0."""
+        years = self.entries["year_published"]
+        first = bisect.bisect_left(years, (1,))
+        return (years[first][0], years[-1][0]) if first < len(years) else None
+
+    def ids(self, sort_by, descending=False, year_from=None, year_to=None):
+        """Book ids in sort_by order, optionally only those published in a year range."""
+        if year_from is None and year_to is None:
+            ids = [book_id for _, book_id in self.entries[sort_by]]
+        elif sort_by == "year_published":
+            ids = [book_id for _, book_id in self.year_range(year_from, year_to)]
+        else:
+            wanted = {book_id for _, book_id in self.year_range(year_from, year_to)}
+            ids = [book_id for _, book_id in self.entries[sort_by] if book_id in wanted]
+        return ids[::-1] if descending else ids
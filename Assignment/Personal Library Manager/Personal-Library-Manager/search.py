@@ -0,0 +1,149 @@
+"""Word and prefix index behind the library search box.
+
+Every word of a book's title, author and genre is a key in a posting list
+of book ids, kept per field.  A sorted list of all words lets a prefix like
+"tolk" find every word starting with it by bisecting.  A query's words must
+all match (each as a word prefix), so the posting lists are intersected,
+smallest first.  Books rank higher when their words match in the title
+rather than the author or genre, and when a word matches exactly rather
+than only as a prefix.
+
+The words are also kept in a fuzzy.TrigramIndex.  fuzzy_search() uses it to
+find books whose words are close to every query word, so typos still
+find something.  It covers the same three fields as search(), genre
+included, because it is what the search box falls back on.  It is not
+saved with the JSON library: it holds distinct words rather than books, so
+rebuilding it on open is quick (about 0.2 s of a 7 s open at 500k books),
+and a saved copy would be one more file to keep in step.
+"""
+import bisect
+import heapq
+import re
+from fuzzy import TrigramIndex
+
+WORD = re.compile(r"\w+")
+FIELDS = {"title": 3, "author": 2, "genre": 1}   # field -> weight when it matches
+FUZZY_LIMIT = 20    # books returned by a fuzzy search
+
+
+def tokenize(text):
+    return set(WORD.findall((text or "").lower()))
+
+
+def similar_words(fuzzy, terms):
+    """For each query word in terms, the (word, similarity) pairs close to it; [] if one has none."""
+    per_term = [fuzzy.similar(term) for term in set(terms)]
+    return per_term if per_term and all(per_term) else []
+
+
+def rank_fuzzy(per_term, limit):
+    """Up to limit (book id, score) pairs, best first, for books hit by every query word.
+
+    per_term has, for each query word, a list of (book ids, score) hits: the
+    books with a close word in some field, and similarity times field weight.
+    A book scores the best of its hits for each query word, summed.
+    """
+    if not per_term or not all(per_term):
+        return []
+    # start from the query word with the fewest candidate books, like search()
+    per_term = sorted(per_term, key=lambda hits: sum(len(ids) for ids, _ in hits))
+    scores = {}
+    for ids, score in per_term[0]:
+        for book_id in ids:
+            if scores.get(book_id, 0) < score:
+                scores[book_id] = score
+    for hits in per_term[1:]:
+        hits = sorted(hits, key=lambda hit: -hit[1])
+        for book_id in list(scores):
+            best = next((score for ids, score in hits if book_id in ids), None)
+            if best is None:
+                del scores[book_id]
+            else:
+                scores[book_id] += best
+    return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+class BookIndex:
+    """Field -> word -> set of book ids, updated as books change."""
+
+    def __init__(self, books=()):
+        self.postings = {field: {} for field in FIELDS}
+        self.words = []         # every indexed word, sorted, for prefix lookups
+        self.fuzzy = TrigramIndex()     # the same words, by trigram, for fuzzy lookups
+        self._uses = {}         # word -> how many posting lists contain it
+        for book in books:
+            self.add(book, sort_words=False)
+        self.words = sorted(self._uses)     # one sort instead of an insort per word
+
+    def add(self, book, sort_words=True):
+        for field in FIELDS:
+            for word in tokenize(book.get(field)):
+                ids = self.postings[field].setdefault(word, set())
+                if not ids:
+                    self._use(word, 1, sort_words)
+                ids.add(book["id"])
+
+    def remove(self, book):
+        for field in FIELDS:
+            for word in tokenize(book.get(field)):
+                ids = self.postings[field].get(word)
+                if ids is None:
+                    continue
+                ids.discard(book["id"])
+                if not ids:
+                    del self.postings[field][word]
+                    self._use(word, -1)
+
+    def _use(self, word, change, sort_words=True):
+        uses = self._uses.get(word, 0) + change
+        if uses and word not in self._uses:
+            if sort_words:
+                bisect.insort(self.words, word)
+            self.fuzzy.add(word)
+        elif not uses:
+            self.words.pop(bisect.bisect_left(self.words, word))
+            self.fuzzy.remove(word)
+            del self._uses[word]
+            return
+        self._uses[word] = uses
+
+    def _with_prefix(self, prefix):
+        start = bisect.bisect_left(self.words, prefix)
+        for word in self.words[start:]:
+            if not word.startswith(prefix):
+                break
+            yield word
+
+    def _scores(self, term):
+        """{book id: score} for books with a word starting with term."""
+        scores = {}
+        for word in self._with_prefix(term):
+            exact = word == term
+            for field, weight in FIELDS.items():
+                score = weight * 2 if exact else weight
+                for book_id in self.postings[field].get(word, ()):
+                    if scores.get(book_id, 0) < score:
+                        scores[book_id] = score
+        return scores
+
+    def search(self, query):
+        """Return {book id: score} for books matching every word of query."""
+        terms = WORD.findall(query.lower())
+        if not terms:
+            return {}
+        per_term = sorted((self._scores(term) for term in terms), key=len)
+        matches = set(per_term[0])
+        for scores in per_term[1:]:
+            matches.intersection_update(scores)
+            if not matches:
+                return {}
+        return {book_id: sum(scores[book_id] for scores in per_term) for book_id in matches}
+
+    def fuzzy_search(self, query, limit=FUZZY_LIMIT):
+        """Return up to limit (book id, score) pairs, best first, for books
+        with a word close to every word of query.
+        """
+        return rank_fuzzy([[(self.postings[field][word], similarity * weight)
+                            for word, similarity in similar
+                            for field, weight in FIELDS.items() if word in self.postings[field]]
+                           for similar in similar_words(self.fuzzy, tokenize(query))], limit)
@@ -0,0 +1,373 @@
+"""SQLite storage for the library.
+
+Each book is one row, so a change touches one row instead of rewriting the
+library.  Indexes on the table answer filters and sorted listings, and an
+FTS5 table answers searches; its word list also feeds fuzzy search.  Facet
+counts and the change log are kept in memory and reloaded when another
+process changes the file.  SqliteRepository has the same methods as
+library.BookRepository, so main.py can use either.
+"""
+import re
+import sqlite3
+import threading
+from collections import Counter
+from changelog import ChangeLog
+from facets import Facets
+from fuzzy import TrigramIndex
+from library import DuplicateISBNError
+from search import FIELDS, FUZZY_LIMIT, rank_fuzzy, similar_words
+
+DB_FILE = "books_library.db"
+COLUMNS = ["id", "title", "author", "genre", "year_published", "isbn", "added_date"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    seq            INTEGER PRIMARY KEY,     -- insertion order; FTS5 rowid
+    id             TEXT    NOT NULL UNIQUE,
+    title          TEXT    NOT NULL,
+    author         TEXT    NOT NULL,
+    genre          TEXT    NOT NULL DEFAULT '',
+    year_published INTEGER NOT NULL DEFAULT 0,
+    isbn           TEXT    NOT NULL DEFAULT '',
+    added_date     TEXT    NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS books_author ON books (author);
+CREATE INDEX IF NOT EXISTS books_genre ON books (genre);
+CREATE INDEX IF NOT EXISTS books_year ON books (year_published);
+CREATE INDEX IF NOT EXISTS books_title_order ON books (lower(title));
+CREATE INDEX IF NOT EXISTS books_author_order ON books (lower(author));
+CREATE INDEX IF NOT EXISTS books_added ON books (added_date);
+CREATE UNIQUE INDEX IF NOT EXISTS books_isbn ON books (isbn) WHERE isbn <> '';
+
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, author, genre, content='books', content_rowid='seq'
+);
+CREATE TRIGGER IF NOT EXISTS books_ai AFTER INSERT ON books BEGIN
+    INSERT INTO books_fts (rowid, title, author, genre)
+    VALUES (new.seq, new.title, new.author, new.genre);
+END;
+CREATE TRIGGER IF NOT EXISTS books_ad AFTER DELETE ON books BEGIN
+    INSERT INTO books_fts (books_fts, rowid, title, author, genre)
+    VALUES ('delete', old.seq, old.title, old.author, old.genre);
+END;
+CREATE TRIGGER IF NOT EXISTS books_au AFTER UPDATE ON books BEGIN
+    INSERT INTO books_fts (books_fts, rowid, title, author, genre)
+    VALUES ('delete', old.seq, old.title, old.author, old.genre);
+    INSERT INTO books_fts (rowid, title, author, genre)
+    VALUES (new.seq, new.title, new.author, new.genre);
+END;
+-- one row per distinct word in books_fts, with how many books contain it
+CREATE VIRTUAL TABLE IF NOT EXISTS books_terms USING fts5vocab(books_fts, 'row');
+-- one row per word per book and field: (term, doc = books.seq, col)
+CREATE VIRTUAL TABLE IF NOT EXISTS books_instances USING fts5vocab(books_fts, 'instance');
+"""
+
+# An empty FTS5 table with the same tokenizer as books_fts.  Text put through
+# it splits into exactly the words books_terms holds (case folded, accents
+# removed), which Python's own \w+ would not match.  Reading them back from
+# books_instances by doc instead would scan the whole index.
+SCRATCH = """
+CREATE VIRTUAL TABLE IF NOT EXISTS temp.scratch_fts USING fts5(text);
+CREATE VIRTUAL TABLE IF NOT EXISTS temp.scratch_terms USING fts5vocab('temp', 'scratch_fts', 'row');
+"""
+
+WORD = re.compile(r"\w+")
+
+ORDERS = {  # ordering.SORT_KEYS key -> the same order in SQL, served by an index
+    "year_published": "year_published",
+    "title": "lower(title)",
+    "author": "lower(author)",
+    "added_date": "added_date",
+}
+
+FACET_COUNTS = {    # facet -> GROUP BY query giving the same values as facets.FACETS
+    "genre": "SELECT genre, count(*) FROM books WHERE genre <> '' GROUP BY genre",
+    "author": "SELECT author, count(*) FROM books WHERE author <> '' GROUP BY author",
+    "decade": "SELECT year_published / 10 * 10, count(*) FROM books"
+              " WHERE year_published > 0 GROUP BY year_published / 10",
+}
+
+
+def row_to_book(row):
+    return dict(zip(COLUMNS, row))
+
+
+def book_values(book):
+    return [book.get(column, 0 if column == "year_published" else "") for column in COLUMNS]
+
+
+def fts_query(text):
+    """Turn 'lord rin' into an FTS5 query: every word as a quoted prefix."""
+    return " ".join(f'"{word}"*' for word in WORD.findall(text.lower()))
+
+
+class SqliteRepository:
+    """Books in an SQLite file; every change is committed right away."""
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        # shared by every Streamlit session, and sessions run on their own threads
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.conn.executescript(SCRATCH)
+        self._lock = threading.Lock()
+        self.changes = ChangeLog()
+        with self._lock:
+            self._load()
+
+    @property
+    def version(self):
+        """Goes up by one on every change, so caches know when to rebuild."""
+        with self._lock:
+            self._sync()
+            return self.changes.version
+
+    def changes_since(self, version):
+        """(current version, {book id: book or None} changed since version, or None to reload)."""
+        with self._lock:
+            self._sync()
+            return self.changes.version, self.changes.changes_since(version)
+
+    def _load(self):
+        """Build the facet counts and fuzzy words from the file; the caller holds self._lock."""
+        # read first: a commit landing while we count will show up at the next _sync
+        self._data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        facets = Facets()
+        facets.total = self.conn.execute("SELECT count(*) FROM books").fetchone()[0]
+        for facet, sql in FACET_COUNTS.items():
+            facets.counts[facet] = Counter(dict(self.conn.execute(sql)))
+        self.facets = facets
+        self.fuzzy = TrigramIndex(term for (term,) in self.conn.execute("SELECT term FROM books_terms"))
+
+    def _sync(self):
+        """Catch up if another connection changed the file; the caller holds self._lock.
+
+        data_version changes when another connection, such as bulk.py or
+        migrate.py in another process, commits to the file.  Those changes
+        are not in the change log, so readers are told to reload.
+        """
+        if self.conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+            self._load()
+            self.changes.reset()
+
+    def _fetch(self, book_id):
+        """The book with this id, or None; the caller holds self._lock."""
+        row = self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM books WHERE id = ?", (book_id,)).fetchone()
+        return row_to_book(row) if row else None
+
+    def _words(self, *texts):
+        """The distinct words books_fts makes of texts; the caller holds self._lock."""
+        self.conn.executemany("INSERT INTO scratch_fts (text) VALUES (?)", ((text or "",) for text in texts))
+        words = [term for (term,) in self.conn.execute("SELECT term FROM scratch_terms")]
+        self.conn.execute("DELETE FROM scratch_fts")
+        return words
+
+    def _learn(self, book):
+        """Count a book just written in the facets and fuzzy words; the caller holds self._lock."""
+        self.facets.add(book)
+        for word in self._words(*(book.get(field) for field in FIELDS)):
+            self.fuzzy.add(word)
+
+    def _forget(self, book):
+        """Undo _learn for a book just changed or deleted; the caller holds self._lock."""
+        self.facets.remove(book)
+        for word in self._words(*(book.get(field) for field in FIELDS)):
+            if not self.conn.execute("SELECT 1 FROM books_terms WHERE term = ?", (word,)).fetchone():
+                self.fuzzy.remove(word)     # no book has this word any more
+
+    def _select(self, where="", params=(), order="seq"):
+        sql = f"SELECT {', '.join(COLUMNS)} FROM books {where} ORDER BY {order}"
+        with self._lock:
+            return [row_to_book(row) for row in self.conn.execute(sql, params)]
+
+    def all(self):
+        """Return the books as a list, in the order they were added."""
+        return self._select()
+
+    def get(self, book_id):
+        books = self._select("WHERE id = ?", (book_id,))
+        return books[0] if books else None
+
+    def find(self, genre=None, year_from=None, year_to=None):
+        """Books in a genre and/or year range, oldest first, answered from the indexes."""
+        clauses, params = self._year_clauses(year_from, year_to)
+        if genre is not None:
+            clauses.append("genre = ?")
+            params.append(genre)
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        return self._select(where, params, order="year_published, id")
+
+    def _year_clauses(self, year_from, year_to):
+        clauses, params = [], []
+        if year_from is not None:
+            clauses.append("year_published >= ?")
+            params.append(year_from)
+        if year_to is not None:
+            clauses.append("year_published <= ?")
+            params.append(year_to)
+        return clauses, params
+
+    def ordered_ids(self, sort_by="added_date", descending=False, year_from=None, year_to=None):
+        """Book ids sorted by sort_by (a key of ordering.SORT_KEYS), optionally in a year range."""
+        clauses, params = self._year_clauses(year_from, year_to)
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        direction = " DESC" if descending else ""
+        sql = f"SELECT id FROM books {where} ORDER BY {ORDERS[sort_by]}{direction}, id{direction}"
+        with self._lock:
+            return [book_id for (book_id,) in self.conn.execute(sql, params)]
+
+    def year_span(self):
+        """(first, last) known publication year, or None if no book has one."""
+        with self._lock:
+            # two lookups at the ends of the year index, rather than a scan between them
+            first, last = self.conn.execute(
+                "SELECT (SELECT min(year_published) FROM books WHERE year_published > 0),"
+                " (SELECT max(year_published) FROM books)").fetchone()
+        return (first, last) if first else None
+
+    def genres(self):
+        """Distinct non-empty genres, sorted."""
+        with self._lock:
+            self._sync()
+            return self.facets.values("genre")
+
+    def stats(self):
+        """Book counts in total and per genre, author and decade."""
+        with self._lock:
+            self._sync()
+            return self.facets.snapshot()
+
+    def search(self, query):
+        """Books matching every word of query as a prefix, best match first.
+
+        bm25 weights title matches above author, and author above genre.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        return self._select(
+            "JOIN (SELECT rowid, bm25(books_fts, 3.0, 2.0, 1.0) AS rank FROM books_fts"
+            " WHERE books_fts MATCH ?) AS hits ON hits.rowid = books.seq",
+            (match,), order="hits.rank, title COLLATE NOCASE",
+        )
+
+    def fuzzy_search(self, query, limit=FUZZY_LIMIT):
+        """Up to limit books with words close to every word of query, closest first."""
+        with self._lock:
+            self._sync()
+            per_term = similar_words(self.fuzzy, self._words(query))
+            if not per_term:
+                return []
+            words = sorted({word for similar in per_term for word, _ in similar})
+            postings = {}   # (word, field) -> seqs of the books with that word in that field
+            for word, seq, field in self.conn.execute(
+                    f"SELECT term, doc, col FROM books_instances WHERE term IN ({', '.join('?' * len(words))})",
+                    words):
+                postings.setdefault((word, field), set()).add(seq)
+            scores = dict(rank_fuzzy([[(postings[word, field], similarity * weight)
+                                       for word, similarity in similar
+                                       for field, weight in FIELDS.items() if (word, field) in postings]
+                                      for similar in per_term], limit))
+            rows = self.conn.execute(
+                f"SELECT seq, {', '.join(COLUMNS)} FROM books WHERE seq IN ({', '.join('?' * len(scores))})",
+                list(scores)).fetchall()
+        rows.sort(key=lambda row: (-scores[row[0]], row[2].lower()))    # row[2] is the title
+        return [row_to_book(row[1:]) for row in rows]
+
+    def add(self, book):
+        try:
+            with self._lock, self.conn:
+                self._sync()
+                self.conn.execute(
+                    f"INSERT INTO books ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    book_values(book),
+                )
+                new = row_to_book(book_values(book))
+                self._learn(new)
+                self.changes.record([(new["id"], new)])
+        except sqlite3.IntegrityError:
+            raise DuplicateISBNError(book.get("isbn")) from None
+
+    def add_many(self, books):
+        """Add books in one transaction, skipping any whose ISBN is taken; return how many were added."""
+        return self.import_books(books)
+
+    def iter_books(self, batch_size=1000):
+        """Yield every book, fetching batch_size rows at a time."""
+        last_seq = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    f"SELECT seq, {', '.join(COLUMNS)} FROM books WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (last_seq, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row_to_book(row[1:])
+            last_seq = rows[-1][0]
+
+    def update(self, book_id, changes):
+        """Apply changes to a book; return False if there is no such book."""
+        columns = [column for column in changes if column in COLUMNS and column != "id"]
+        try:
+            with self._lock, self.conn:
+                self._sync()
+                old = self._fetch(book_id)
+                if old is None:
+                    return False
+                self.conn.execute(
+                    f"UPDATE books SET {', '.join(f'{c} = ?' for c in columns)} WHERE id = ?",
+                    [changes[column] for column in columns] + [book_id],
+                )
+                new = self._fetch(book_id)
+                self._forget(old)
+                self._learn(new)
+                self.changes.record([(book_id, new)])
+        except sqlite3.IntegrityError:
+            raise DuplicateISBNError(changes.get("isbn")) from None
+        return True
+
+    def delete(self, book_id):
+        """Remove a book; return False if there is no such book."""
+        with self._lock, self.conn:
+            self._sync()
+            book = self._fetch(book_id)
+            if book is None:
+                return False
+            self.conn.execute("DELETE FROM books WHERE id = ?", (book_id,))
+            self._forget(book)
+            self.changes.record([(book_id, None)])
+            return True
+
+    def replace_all(self, books_data):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM books")
+            self.facets = Facets()
+            self.fuzzy = TrigramIndex()
+            self.changes.reset()
+        self.import_books(books_data)
+
+    def import_books(self, books_data):
+        """Insert books in one transaction, skipping ids or ISBNs already present.
+
+        Returns how many were inserted.
+        """
+        sql = (f"INSERT OR IGNORE INTO books ({', '.join(COLUMNS)})"
+               f" VALUES ({', '.join('?' * len(COLUMNS))})")
+        added = []
+        with self._lock, self.conn:
+            self._sync()
+            # a row at a time, to know which books went in and which were ignored
+            for book in books_data:
+                values = book_values(book)
+                if self.conn.execute(sql, values).rowcount:
+                    new = row_to_book(values)
+                    self._learn(new)
+                    added.append((new["id"], new))
+            if added:
+                self.changes.record(added)
+        return len(added)
+
+    def flush(self):
+        """Nothing to do: every change is already committed."""
@@ -23,6 +23,10 @@ PBKDF2_ITERATIONS = 100000 # More iterations mean stronger hashing, but slightly
 MAX_FAILED_ATTEMPTS = 3
 LOCKOUT_DURATION_MINUTES = 5
 
+# The encryption key derived at login is kept in memory for this session only,
+# and dropped after this many minutes without any activity
+KEY_CACHE_IDLE_MINUTES = 15
+
 # A fixed, application-wide salt for deriving Fernet keys from user passwords.
 # This is crucial for consistent key derivation across sessions.
 # In a production app, this would be loaded from a truly secure, external source.
@@ -154,16 +158,14 @@ def derive_encryption_key_from_password(password):
     derived_key = base64.urlsafe_b64encode(kdf.derive(password.encode('utf-8')))
     return derived_key
 
-def encrypt_user_message(message_text, user_password):
-    """Encrypts a plaintext message using a key derived from the user's password."""
-    encryption_key = derive_encryption_key_from_password(user_password)
+def encrypt_user_message(message_text, encryption_key):
+    """Encrypts a plaintext message using the key derived from the user's password."""
     f = Fernet(encryption_key)
     encrypted_bytes = f.encrypt(message_text.encode('utf-8'))
     return base64.b64encode(encrypted_bytes).decode('utf-8') # Store as base64 string for JSON
 
-def decrypt_user_message(encrypted_b64_string, user_password):
-    """Decrypts a base64-encoded encrypted message using a key derived from the password."""
-    encryption_key = derive_encryption_key_from_password(user_password)
+def decrypt_user_message(encrypted_b64_string, encryption_key):
+    """Decrypts a base64-encoded encrypted message using the key derived from the password."""
     f = Fernet(encryption_key)
     try:
         decrypted_bytes = f.decrypt(base64.b64decode(encrypted_b64_string))
@@ -173,6 +175,39 @@ def decrypt_user_message(encrypted_b64_string, user_password):
         st.error(f"Decryption failed! Check your password or if the data is corrupted. Error: {e}")
         return None
 
+# --- Session Key Cache ---
+# Deriving the key costs a full PBKDF2 run, so it is done once at login and the
+# result is kept in st.session_state: memory only, and private to this session.
+
+def cache_session_encryption_key(encryption_key):
+    """Keeps the derived key for this session and starts its idle timer."""
+    st.session_state.session_encryption_key = encryption_key
+    st.session_state.session_key_last_used = datetime.now()
+
+def get_session_encryption_key():
+    """Returns the cached key and resets its idle timer, or None if it is missing or has expired."""
+    encryption_key = st.session_state.get("session_encryption_key")
+    last_used = st.session_state.get("session_key_last_used")
+    if encryption_key is None or datetime.now() - last_used > timedelta(minutes=KEY_CACHE_IDLE_MINUTES):
+        clear_session_encryption_key()
+        return None
+    st.session_state.session_key_last_used = datetime.now()
+    return encryption_key
+
+def clear_session_encryption_key():
+    """Wipes the cached key from this session."""
+    st.session_state.session_encryption_key = None
+    st.session_state.session_key_last_used = None
+
+def end_user_session(feedback_message=""):
+    """Logs the user out and wipes everything kept for them in this session."""
+    clear_session_encryption_key()
+    st.session_state.logged_in = False
+    st.session_state.current_username = None
+    st.session_state.login_feedback_message = feedback_message
+    st.session_state.register_feedback_message = ""
+    st.session_state.login_password_input_value = "" # Ensure login password field is clear for next login
+
 # --- User-Specific Encrypted Data Management ---
 
 def load_user_encrypted_data(username): # Renamed function for clarity
@@ -200,8 +235,8 @@ if 'login_feedback_message' not in st.session_state:
     st.session_state.login_feedback_message = ""
 if 'register_feedback_message' not in st.session_state:
     st.session_state.register_feedback_message = ""
-if 'user_session_password' not in st.session_state: # Stores the password for encryption/decryption
-    st.session_state.user_session_password = None
+if 'session_encryption_key' not in st.session_state: # Key derived from the password at login; never written to disk
+    clear_session_encryption_key()
 # This is used to clear the password input field after submission
 if 'login_password_input_value' not in st.session_state:
     st.session_state.login_password_input_value = ""
@@ -241,7 +276,8 @@ if not st.session_state.logged_in:
                 if success:
                     st.session_state.logged_in = True
                     st.session_state.current_username = login_username_input
-                    st.session_state.user_session_password = login_password_input 
+                    # Derive the encryption key once here; the password itself is not kept
+                    cache_session_encryption_key(derive_encryption_key_from_password(login_password_input))
                     st.session_state.login_password_input_value = "" # Clear password field on successful login
                     st.success(message) # Display success message
                     st.rerun() # Rerun to switch to main app view
@@ -262,8 +298,8 @@ if not st.session_state.logged_in:
                 # Display wrong input counter only for non-lockout failed attempts
                 users_data = get_all_users()
                 user_data = users_data.get(login_username_input)
-                # Ensure user_data exists and they are not logged in (implying a failed attempt)
-                if user_data and not st.session_state.logged_in:
+                # Ensure user_data exists with failed attempts and they are not logged in (e.g. not an idle timeout)
+                if user_data and user_data['failed_attempts'] and not st.session_state.logged_in:
                     st.info(f"Wrong attempts: {user_data['failed_attempts']} / {MAX_FAILED_ATTEMPTS}")
 
     st.markdown("---")
@@ -291,15 +327,16 @@ if not st.session_state.logged_in:
 
 # --- Main Application Section (displayed after successful login) ---
 else:
+    session_encryption_key = get_session_encryption_key()
+    if session_encryption_key is None:
+        # Idle for too long: the cached key is gone, so the password is needed again
+        end_user_session(f"Your session was idle for more than {KEY_CACHE_IDLE_MINUTES} minutes. Please log in again.")
+        st.rerun()
+
     st.sidebar.header(f"Welcome, {st.session_state.current_username}!")
     if st.sidebar.button("Logout"):
-        # Clear all relevant session state on logout
-        st.session_state.logged_in = False
-        st.session_state.current_username = None
-        st.session_state.user_session_password = None 
-        st.session_state.login_feedback_message = ""
-        st.session_state.register_feedback_message = ""
-        st.session_state.login_password_input_value = "" # Ensure login password field is clear for next login
+        # Clear all relevant session state on logout, including the cached key
+        end_user_session()
         st.success("You have been securely logged out.")
         st.rerun() # Force rerun to show login page
 
@@ -310,8 +347,8 @@ else:
         if message_to_encrypt:
             with st.spinner("Encrypting and securely saving your message..."):
                 try:
-                    # Use the password stored in session state for encryption
-                    encrypted_message_content = encrypt_user_message(message_to_encrypt, st.session_state.user_session_password) 
+                    # Use the key cached at login for encryption
+                    encrypted_message_content = encrypt_user_message(message_to_encrypt, session_encryption_key)
                     user_messages_list = load_user_encrypted_data(st.session_state.current_username)
                     user_messages_list.append({
                         "message_content": encrypted_message_content,
@@ -350,8 +387,8 @@ else:
             # Unique key for each button is important
             if st.button(f"Decrypt This Message", key=f"decrypt_btn_{i}_{item['timestamp']}"): # More robust key
                 with st.spinner("Attempting decryption..."):
-                    # Use the password stored in session state for decryption
-                    decrypted_text = decrypt_user_message(item['message_content'], st.session_state.user_session_password) 
+                    # Use the key cached at login for decryption
+                    decrypted_text = decrypt_user_message(item['message_content'], session_encryption_key)
                     if decrypted_text is not None:
                         st.success("Decrypted Message:")
                         st.info(decrypted_text)
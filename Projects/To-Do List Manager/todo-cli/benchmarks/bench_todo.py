@@ -0,0 +1,180 @@
+"""How `todo` commands scale with the size of the list.
+
+Usage:
+    python benchmarks/bench_todo.py [--sizes 1000,10000,100000,1000000]
+        [--store json] [--repeat 5] [--output results.json]
+        [--baseline baseline.json] [--tolerance 1.25]
+
+For every size a fresh store with that many tasks is generated in a temp
+directory.  Then list, add, complete and delete are each run --repeat times
+in two ways:
+
+* "runner": in-process through click's CliRunner.  This measures the
+  command itself.
+* "subprocess": as a new `python todo.py ...` process.  This is a cold start
+  and includes interpreter startup and imports.
+
+Each case reports p50/p90/max latency in milliseconds and peak memory:
+* subprocess runs: peak RSS of the child.
+* runner runs: peak Python allocation, traced in one extra untimed run.
+
+Results are written as JSON.  With --baseline, each case's p50 is compared to
+the baseline.  The script exits with status 1 if any case is slower by more
+than --tolerance times.  To make a new baseline, copy a results file.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from click.testing import CliRunner
+
+import todo
+from search_index import SearchIndex
+
+TODO = os.path.join(os.path.dirname(HERE), "todo.py")
+COMMANDS = ["list", "add", "complete", "delete"]
+
+# Runs one command and reports (seconds, exit code, peak RSS).  On Linux a
+# child's peak RSS includes that of whoever forked it, so the timed command is
+# started from this small process rather than from the benchmark itself.
+LAUNCHER = """
+import json, os, subprocess, sys, time
+start = time.perf_counter()
+child = subprocess.Popen(sys.argv[1:], stdout=subprocess.DEVNULL)
+_, status, usage = os.wait4(child.pid, 0)
+print(json.dumps([time.perf_counter() - start, os.waitstatus_to_exitcode(status), usage.ru_maxrss]))
+"""
+
+
+def generate(directory, store_name, size):
+    """Create a store with size tasks (every 10th one done) and its index."""
+    store = todo.STORES[store_name](directory)
+    store.save([{"task": f"synthetic task {i}", "done": i % 10 == 0} for i in range(size)])
+    # build the search index now so the first timed write doesn't pay for it
+    SearchIndex(directory, store_name=store_name).rebuild(store.iter_tasks())
+
+
+def arguments(command, size):
+    middle = str(max(1, size // 2))
+    return {"list": ["list"], "add": ["add", "benchmark task"],
+            "complete": ["complete", middle], "delete": ["delete", middle]}[command]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summary(times, peak_kb):
+    return {"p50_ms": round(percentile(times, 0.5) * 1000, 2),
+            "p90_ms": round(percentile(times, 0.9) * 1000, 2),
+            "max_ms": round(max(times) * 1000, 2),
+            "peak_kb": peak_kb}
+
+
+def run_subprocess(directory, store_name, args, repeat):
+    times = []
+    peak_kb = 0
+    env = dict(os.environ, TODO_STORE=store_name)
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", LAUNCHER, sys.executable, TODO] + args,
+                                cwd=directory, env=env, capture_output=True, text=True).stdout
+        seconds, status, max_rss = json.loads(output)
+        if status:
+            raise SystemExit(f"`todo {' '.join(args)}` failed with status {status}")
+        times.append(seconds)
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        peak_kb = max(peak_kb, max_rss // (1024 if sys.platform == "darwin" else 1))
+    return summary(times, peak_kb)
+
+
+def run_runner(directory, store_name, args, repeat):
+    runner = CliRunner()
+    cwd = os.getcwd()
+    os.chdir(directory)     # the stores and the index live in the current directory
+    try:
+        def invoke():
+            result = runner.invoke(todo.cli, ["--store", store_name] + args)
+            if result.exit_code:
+                raise SystemExit(f"`todo {' '.join(args)}` failed: {result.output}")
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            invoke()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        invoke()
+        peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    finally:
+        os.chdir(cwd)
+    return summary(times, peak_kb)
+
+
+def compare(results, baseline, tolerance):
+    """Print p50 against the baseline; return the number of regressions."""
+    old = {(case["size"], case["command"], case["mode"]): case for case in baseline["cases"]}
+    regressions = 0
+    for case in results["cases"]:
+        before = old.get((case["size"], case["command"], case["mode"]))
+        if not before:
+            continue
+        ratio = case["p50_ms"] / max(before["p50_ms"], 0.01)
+        flag = ""
+        if ratio > tolerance:
+            flag = "  <-- REGRESSION"
+            regressions += 1
+        print(f"{case['size']:>8} {case['command']:<9} {case['mode']:<10} "
+              f"{before['p50_ms']:>9.1f} -> {case['p50_ms']:>9.1f} ms  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--store", choices=sorted(todo.STORES), default="json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+
+    results = {"store": args.store, "python": platform.python_version(),
+               "platform": platform.platform(), "cases": []}
+    for size in (int(size) for size in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            generate(directory, args.store, size)
+            print(f"{size} tasks generated in {time.perf_counter() - start:.1f}s")
+            for command in COMMANDS:
+                for mode, run in (("runner", run_runner), ("subprocess", run_subprocess)):
+                    case = run(directory, args.store, arguments(command, size), args.repeat)
+                    case.update(size=size, command=command, mode=mode)
+                    results["cases"].append(case)
+                    print(f"{size:>8} {command:<9} {mode:<10} p50 {case['p50_ms']:>9.1f} ms"
+                          f"  p90 {case['p90_ms']:>9.1f} ms  peak {case['peak_kb']:>8} KiB")
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            raise SystemExit(f"{regressions} case(s) slower than the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Startup check for quick.py: keep the prompt-hook path cheap.
+
+Usage: python benchmarks/check_startup.py [--budget-ms 15] [--tasks 1000]
+
+In a temp directory with --tasks tasks and a fresh todo.summary, this runs
+``python -X importtime quick.py list --pending --count``.  It fails if:
+- click or json gets imported;
+- the answer is wrong;
+- the modules imported beyond what a bare ``python -c pass`` imports take
+  longer than --budget-ms in total.
+It also prints the wall-clock time of quick.py and todo.py for the same
+query, for comparison.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+from record_store import RecordStore
+
+FORBIDDEN = {"click", "json"}
+
+
+def imports(args, cwd):
+    """Run python -X importtime; return ({top-level module: cumulative us}, stdout)."""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=cwd,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # nested imports are indented; only count each top-level import once
+        if not name[1:].startswith(" "):
+            modules[name.strip()] = int(cumulative)
+    return modules, result.stdout.strip()
+
+
+def wall_ms(args, cwd, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=15.0,
+                        help="allowed import time on top of a bare interpreter")
+    parser.add_argument("--tasks", type=int, default=1000)
+    args = parser.parse_args()
+
+    quick = os.path.join(ROOT, "quick.py")
+    todo = os.path.join(ROOT, "todo.py")
+    with tempfile.TemporaryDirectory() as directory:
+        RecordStore(directory).save([{"task": f"task {i}", "done": i % 2 == 0}
+                                      for i in range(args.tasks)])
+        # the summary is only written for files older than a couple of seconds
+        old = time.time() - 60
+        for name in os.listdir(directory):
+            os.utime(os.path.join(directory, name), (old, old))
+        subprocess.run([sys.executable, todo, "list", "--count"], cwd=directory,
+                       check=True, stdout=subprocess.DEVNULL)
+        if not os.path.exists(os.path.join(directory, "todo.summary")):
+            raise SystemExit("todo.py did not write todo.summary")
+
+        bare, _ = imports(["-c", "pass"], directory)
+        fast, output = imports([quick, "list", "--pending", "--count"], directory)
+        if output != str(args.tasks // 2):
+            raise SystemExit(f"quick.py answered {output!r}, expected {args.tasks // 2}")
+        forbidden = FORBIDDEN & {name.split(".")[0] for name in fast}
+        if forbidden:
+            raise SystemExit(f"quick.py imported {', '.join(sorted(forbidden))}")
+        extra = {name: us for name, us in fast.items() if name not in bare}
+        extra_ms = sum(extra.values()) / 1000
+        for name, us in sorted(extra.items(), key=lambda item: -item[1]):
+            print(f"  {name:<30} {us / 1000:6.2f} ms")
+        print(f"imports beyond a bare interpreter: {extra_ms:.2f} ms (budget {args.budget_ms} ms)")
+
+        query = ["list", "--pending", "--count"]
+        print(f"quick.py {' '.join(query)}: {wall_ms([quick] + query, directory):6.1f} ms")
+        print(f"todo.py  {' '.join(query)}: {wall_ms([todo] + query, directory):6.1f} ms")
+        if extra_ms > args.budget_ms:
+            raise SystemExit("quick.py startup is over budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Stress test: many processes adding tasks to the same store at once.
+
+Usage: python benchmarks/stress_writers.py [--tasks 200] [--store json] [--cli]
+
+For 1, 2, 4 and 8 writer processes, each writer adds --tasks tasks one at a
+time.  Afterwards the store must hold every task exactly once with unique
+ids, otherwise the run fails.  Prints the throughput for each writer count.
+With --cli every add is a separate `todo add` process, like a shell loop.
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from record_store import RecordStore
+from sqlite_store import SqliteStore
+
+STORES = {"json": RecordStore, "sqlite": SqliteStore}
+TODO = os.path.join(os.path.dirname(HERE), "todo.py")
+
+
+def writer(directory, store_name, worker, tasks, use_cli):
+    """Add tasks one by one, the way separate `todo add` calls would."""
+    if use_cli:
+        for i in range(tasks):
+            subprocess.run([sys.executable, TODO, "--store", store_name, "add", f"w{worker}-{i}"],
+                           cwd=directory, check=True, stdout=subprocess.DEVNULL)
+        return
+    store = STORES[store_name](directory)
+    for i in range(tasks):
+        store.add(f"w{worker}-{i}")
+
+
+def run(store_name, writers, tasks, use_cli):
+    """Run one round and return tasks per second; raise if anything was lost."""
+    with tempfile.TemporaryDirectory() as directory:
+        STORES[store_name](directory)     # create the files before the race starts
+        processes = [multiprocessing.Process(target=writer,
+                                             args=(directory, store_name, w, tasks, use_cli))
+                     for w in range(writers)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        if any(process.exitcode for process in processes):
+            raise SystemExit(f"{writers} writers: a writer process failed")
+
+        loaded = STORES[store_name](directory).load()
+        expected = {f"w{w}-{i}" for w in range(writers) for i in range(tasks)}
+        ids = [task["id"] for task in loaded]
+        if len(loaded) != len(expected) or {task["task"] for task in loaded} != expected:
+            raise SystemExit(f"{writers} writers: expected {len(expected)} tasks, found {len(loaded)}")
+        if len(set(ids)) != len(ids):
+            raise SystemExit(f"{writers} writers: duplicate task ids")
+        return len(expected) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=200, help="tasks added by each writer")
+    parser.add_argument("--store", choices=sorted(STORES), default="json")
+    parser.add_argument("--cli", action="store_true", help="add through the todo command")
+    args = parser.parse_args()
+
+    print(f"store={args.store} tasks per writer={args.tasks} cli={args.cli}")
+    for writers in (1, 2, 4, 8):
+        rate = run(args.store, writers, args.tasks, args.cli)
+        print(f"{writers} writer(s): {rate:8.0f} tasks/s  (all tasks present, ids unique)")
+
+
+if __name__ == "__main__":
+    main()
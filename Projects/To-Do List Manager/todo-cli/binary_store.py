@@ -0,0 +1,229 @@
+"""Compact binary storage for the todo list, read through mmap.
+
+``todo.bin`` is laid out as::
+
+    header    magic, version, task count, done count, next id
+    ids       one uint64 per task, ascending
+    offsets   count + 1 uint64 positions in the string heap
+    done      one bit per task
+    priority  one byte per task, 0 when unset
+    due       one uint32 per task: the date's ordinal, 0 when unset
+    heap      the task texts as UTF-8, back to back
+
+Every table has a fixed size worked out from the count, so counting tasks
+reads the header, task N is a handful of unpacks plus one slice of the heap,
+and an id is found by bisecting the ids table.  Nothing else is decoded.
+Completing a task flips one bit in place; adding or deleting rewrites the
+file, so this format suits lists that are read far more than they change.
+"""
+import bisect
+import datetime
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from locking import FileLock
+from query import ByPosition, count_tasks, make_task, select_tasks
+
+BIN_FILE = "todo.bin"
+LOCK_FILE = "todo.lock"
+MAGIC = b"TODB"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHxxIIQ")     # magic, version, count, done, next id
+U64 = struct.Struct("<Q")
+U32 = struct.Struct("<I")
+
+
+class Layout:
+    """Where each table starts for a file holding count tasks."""
+
+    def __init__(self, count):
+        self.count = count
+        self.ids = HEADER.size
+        self.offsets = self.ids + U64.size * count
+        self.done = self.offsets + U64.size * (count + 1)
+        self.priority = self.done + (count + 7) // 8
+        self.due = self.priority + count
+        self.heap = self.due + U32.size * count
+
+
+class Column:
+    """Fixed-size integers in the mapped file, indexable so bisect can search them."""
+
+    def __init__(self, view, start, fmt, length):
+        self.view = view
+        self.start = start
+        self.fmt = fmt
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return self.fmt.unpack_from(self.view, self.start + self.fmt.size * i)[0]
+
+
+class BinaryStore(ByPosition):
+    """Task store backed by one memory-mapped binary file."""
+
+    rewrites_on_change = True   # adding or deleting rewrites the whole file
+
+    def __init__(self, directory="."):
+        self.path = os.path.join(directory, BIN_FILE)
+        self._lock = FileLock(os.path.join(directory, LOCK_FILE))
+        with self._lock:
+            if not os.path.exists(self.path):
+                self.save([])
+
+    # --- reading ---
+
+    @contextmanager
+    def _mapped(self, write=False):
+        """Yield (mmap, header, layout) for the current file."""
+        with open(self.path, "r+b" if write else "rb") as file:
+            access = mmap.ACCESS_WRITE if write else mmap.ACCESS_READ
+            with mmap.mmap(file.fileno(), 0, access=access) as view:
+                magic, version, count, done, next_id = HEADER.unpack_from(view)
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError(f"{self.path} is not a version {VERSION} todo file")
+                yield view, {"count": count, "done": done, "next_id": next_id}, Layout(count)
+
+    def _task(self, view, layout, i):
+        """Decode task i (0-based) and nothing else."""
+        task_id = U64.unpack_from(view, layout.ids + U64.size * i)[0]
+        start, end = struct.unpack_from("<QQ", view, layout.offsets + U64.size * i)
+        text = view[layout.heap + start:layout.heap + end].decode()
+        done = view[layout.done + i // 8] >> (i % 8) & 1
+        priority = view[layout.priority + i]
+        due = U32.unpack_from(view, layout.due + U32.size * i)[0]
+        return make_task(task_id, text, done,
+                         datetime.date.fromordinal(due).isoformat() if due else None, priority)
+
+    def _index_of(self, view, layout, task_id):
+        """Position of task_id in the file, or None."""
+        ids = Column(view, layout.ids, U64, layout.count)
+        i = bisect.bisect_left(ids, task_id)
+        return i if i < layout.count and ids[i] == task_id else None
+
+    def iter_tasks(self):
+        """Yield tasks in order, decoding one at a time."""
+        with self._mapped() as (view, header, layout):
+            for i in range(layout.count):
+                yield self._task(view, layout, i)
+
+    def load(self):
+        """Return all tasks as a list."""
+        return list(self.iter_tasks())
+
+    def select(self, done=None, grep=None, offset=0, limit=None):
+        if done is not None or grep:
+            return select_tasks(self.iter_tasks(), done=done, grep=grep, offset=offset, limit=limit)
+        return self._page(offset, limit)
+
+    def _page(self, offset, limit):
+        # no filter: jump straight to the requested slice of the tables
+        with self._mapped() as (view, header, layout):
+            stop = layout.count if limit is None else min(layout.count, offset + limit)
+            for i in range(offset, stop):
+                yield i + 1, self._task(view, layout, i)
+
+    def count(self, done=None, grep=None):
+        """Count tasks; without --grep the answer comes from the header."""
+        if grep:
+            return count_tasks(self.iter_tasks(), done=done, grep=grep)
+        with self._mapped() as (view, header, layout):
+            if done is None:
+                return header["count"]
+            return header["done"] if done else header["count"] - header["done"]
+
+    def next_id(self):
+        with self._mapped() as (view, header, layout):
+            return header["next_id"]
+
+    def ids_at(self, numbers):
+        """Return {task id: number} by reading the ids table directly."""
+        with self._mapped() as (view, header, layout):
+            ids = Column(view, layout.ids, U64, layout.count)
+            return {ids[n - 1]: n for n in numbers if 0 < n <= layout.count}
+
+    # --- writing ---
+
+    def _write(self, tasks, next_id):
+        """Write tasks (dicts with ids, in id order) as a fresh file."""
+        count = len(tasks)
+        ids, offsets, due = [], [0], []
+        done = bytearray((count + 7) // 8)
+        priority = bytearray(count)
+        heap = bytearray()
+        for i, task in enumerate(tasks):
+            ids.append(task["id"])
+            heap += task["task"].encode()
+            offsets.append(len(heap))
+            if task["done"]:
+                done[i // 8] |= 1 << (i % 8)
+            priority[i] = task.get("priority") or 0
+            due.append(datetime.date.fromisoformat(task["due"]).toordinal() if task.get("due") else 0)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, count, sum(bool(t["done"]) for t in tasks), next_id))
+            file.write(struct.pack(f"<{count}Q", *ids))
+            file.write(struct.pack(f"<{count + 1}Q", *offsets))
+            file.write(done)
+            file.write(priority)
+            file.write(struct.pack(f"<{count}I", *due))
+            file.write(heap)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def save(self, tasks, next_id=None):
+        """Replace every task at once; tasks without an id get a new one."""
+        with self._lock:
+            start = self.next_id() if os.path.exists(self.path) else 1
+            next_id = max([start, next_id or 0] + [task["id"] + 1 for task in tasks if "id" in task])
+            numbered = []
+            for task in tasks:
+                if "id" not in task:
+                    task = {"id": next_id, **task}
+                    next_id += 1
+                numbered.append(make_task(task["id"], task["task"], task["done"],
+                                          task.get("due"), task.get("priority")))
+            self._write(numbered, next_id)
+
+    def add_many(self, texts, due=None, priority=None):
+        """Add tasks by rewriting the file once; return the new tasks."""
+        with self._lock:
+            tasks = self.load()
+            next_id = self.next_id()
+            added = [make_task(next_id + i, text, due=due, priority=priority)
+                     for i, text in enumerate(texts)]
+            self._write(tasks + added, next_id + len(added))
+        return added
+
+    def complete_ids(self, ids):
+        """Mark tasks done by setting their bits in place; return the tasks that exist."""
+        completed = []
+        with self._lock, self._mapped(write=True) as (view, header, layout):
+            for task_id in sorted(set(ids)):
+                i = self._index_of(view, layout, task_id)
+                if i is None:
+                    continue
+                if not view[layout.done + i // 8] >> (i % 8) & 1:
+                    view[layout.done + i // 8] |= 1 << (i % 8)
+                    header["done"] += 1
+                completed.append(self._task(view, layout, i))
+            HEADER.pack_into(view, 0, MAGIC, VERSION, header["count"], header["done"],
+                             header["next_id"])
+            view.flush()
+        return completed
+
+    def delete_ids(self, ids):
+        """Delete tasks by id, rewriting the file; return the tasks that were deleted."""
+        doomed = set(ids)
+        with self._lock:
+            tasks = self.load()
+            deleted = [task for task in tasks if task["id"] in doomed]
+            if deleted:
+                self._write([task for task in tasks if task["id"] not in doomed], self.next_id())
+        return deleted
@@ -0,0 +1,269 @@
+"""Resident todo server and its Unix-socket client.
+
+``todo serve`` loads the tasks once and keeps them in memory.  The other
+commands send one JSON line per request over the store's socket (``todo.json.sock``
+for the json store, and so on) and read one JSON line back, so they skip
+loading the task file.  Each store has its own socket, so a command only
+talks to a server for the store it was asked to use.  Changes are written to the
+real store by a background thread shortly afterwards, which turns a burst of
+commands into one write.  The server logs each change and replays it with the
+store's own add_many, complete_ids and delete_ids, so the sqlite and json
+stores only touch the rows that changed; the binary store rewrites its file on
+every change anyway and gets a single save instead.
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from query import ByPosition, count_tasks, make_task, select_tasks
+
+SOCKET_FILE = "todo.{store}.sock"
+FLUSH_DELAY = 0.5   # seconds to let more changes pile up before saving
+
+READS = {"load", "select", "count", "next_id"}
+WRITES = {"add_many", "complete_ids", "delete_ids", "complete_many", "delete_many", "save"}
+
+
+class MemoryStore(ByPosition):
+    """The server's copy of the tasks: a dict keyed by id, in list order."""
+
+    def __init__(self, tasks, next_id):
+        self.tasks = {task["id"]: task for task in tasks}
+        self.next_id_value = next_id
+
+    def next_id(self):
+        return self.next_id_value
+
+    def iter_tasks(self):
+        return iter(self.tasks.values())
+
+    def load(self):
+        return [dict(task) for task in self.tasks.values()]
+
+    def select(self, **filters):
+        return list(select_tasks(self.iter_tasks(), **filters))
+
+    def count(self, done=None, grep=None):
+        return count_tasks(self.iter_tasks(), done=done, grep=grep)
+
+    def save(self, tasks, next_id=None):
+        self.tasks = {}
+        for task in tasks:
+            if "id" not in task:
+                task = {"id": self.next_id_value, **task}
+                self.next_id_value += 1
+            self.tasks[task["id"]] = task
+        self.next_id_value = max([self.next_id_value, next_id or 0] +
+                                 [task_id + 1 for task_id in self.tasks])
+
+    def add_many(self, texts, due=None, priority=None):
+        added = []
+        for text in texts:
+            task = make_task(self.next_id_value, text, due=due, priority=priority)
+            self.tasks[task["id"]] = task
+            self.next_id_value += 1
+            added.append(task)
+        return added
+
+    def complete_ids(self, ids):
+        completed = [self.tasks[task_id] for task_id in ids if task_id in self.tasks]
+        for task in completed:
+            task["done"] = True
+        return completed
+
+    def delete_ids(self, ids):
+        return [self.tasks.pop(task_id) for task_id in ids if task_id in self.tasks]
+
+
+def _options(task):
+    return task.get("due"), task.get("priority")
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Answer newline-delimited JSON requests until the client hangs up."""
+
+    def handle(self):
+        for line in self.rfile:
+            request = json.loads(line)
+            reply = self.server.dispatch(request["cmd"], request.get("args", []),
+                                         request.get("kwargs", {}))
+            self.wfile.write(reply.encode() + b"\n")
+
+
+class TaskServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Keeps the task list in memory and saves it to a store in the background."""
+
+    daemon_threads = True
+
+    def __init__(self, store, path):
+        self.store = store
+        self.memory = MemoryStore(store.load(), store.next_id())
+        self.changes = []       # ("add", tasks), ("complete", ids) or ("delete", ids), oldest first
+        self.resave = getattr(store, "rewrites_on_change", False)
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.dirty = threading.Event()
+        super().__init__(path, RequestHandler)
+        threading.Thread(target=self._flush_loop, name="todo-flush", daemon=True).start()
+
+    def dispatch(self, cmd, args, kwargs):
+        """Run one store method on the in-memory tasks and return the JSON reply."""
+        if cmd not in READS | WRITES:
+            return json.dumps({"error": f"unknown command {cmd!r}"})
+        with self.lock:
+            result = getattr(self.memory, cmd)(*args, **kwargs)
+            if cmd in WRITES and (result or cmd == "save"):
+                self._log(cmd, result)
+                self.dirty.set()
+            # encode while holding the lock so no other request changes it mid-way
+            return json.dumps({"result": result})
+
+    def _flush_loop(self):
+        while True:
+            self.dirty.wait()
+            time.sleep(FLUSH_DELAY)
+            self.flush()
+
+    def _log(self, cmd, result):
+        """Remember a change for the next flush, merged into the last one if alike."""
+        if cmd == "save":
+            self.resave = True
+            return
+        if cmd == "add_many":
+            change = ("add", result)
+        else:
+            tasks = [pair[1] for pair in result] if cmd.endswith("_many") else result
+            change = (cmd.split("_")[0], [task["id"] for task in tasks])
+        last = self.changes[-1] if self.changes else None
+        if last and last[0] == change[0] and (change[0] != "add" or
+                                               _options(last[1][0]) == _options(result[0])):
+            last[1].extend(change[1])
+        else:
+            self.changes.append(change)
+
+    def flush(self):
+        """Write the changes since the last flush to the store, if there are any."""
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty.is_set():
+                    return
+                self.dirty.clear()
+                changes, self.changes = self.changes, []
+            if not self.resave and self._replay(changes):
+                return
+            # a save, a store that rewrites its file anyway, or a store that
+            # someone else has written to: replace it with our copy
+            with self.lock:
+                self.dirty.clear()
+                self.changes = []
+                self.resave = getattr(self.store, "rewrites_on_change", False)
+                tasks = self.memory.load()
+                next_id = self.memory.next_id()
+            self.store.save(tasks, next_id)
+
+    def _replay(self, changes):
+        """Apply logged changes to the store; False if it handed out different ids."""
+        for kind, items in changes:
+            if kind == "add":
+                due, priority = _options(items[0])
+                added = self.store.add_many([task["task"] for task in items],
+                                            due=due, priority=priority)
+                if [task["id"] for task in added] != [task["id"] for task in items]:
+                    return False
+            elif kind == "complete":
+                self.store.complete_ids(items)
+            else:
+                self.store.delete_ids(items)
+        return True
+
+
+class RemoteStore(ByPosition):
+    """Client side of the server, with the same methods as the local stores."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile("rwb")
+
+    def _call(self, cmd, *args, **kwargs):
+        request = {"cmd": cmd, "args": args, "kwargs": kwargs}
+        self.file.write(json.dumps(request).encode() + b"\n")
+        self.file.flush()
+        return json.loads(self.file.readline())["result"]
+
+    def next_id(self):
+        return self._call("next_id")
+
+    def load(self):
+        return self._call("load")
+
+    def iter_tasks(self):
+        return iter(self.load())
+
+    def select(self, **filters):
+        # filtering happens on the server so only the page crosses the socket
+        return iter(self._call("select", **filters))
+
+    def count(self, done=None, grep=None):
+        return self._call("count", done=done, grep=grep)
+
+    def save(self, tasks, next_id=None):
+        self._call("save", tasks, next_id)
+
+    def add_many(self, texts, due=None, priority=None, chunk_size=1000):
+        # send big imports in chunks so neither side holds them all at once
+        added = []
+        chunk = []
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) == chunk_size:
+                added += self._call("add_many", chunk, due=due, priority=priority)
+                chunk = []
+        if chunk:
+            added += self._call("add_many", chunk, due=due, priority=priority)
+        return added
+
+    def complete_ids(self, ids):
+        return self._call("complete_ids", sorted(set(ids)))
+
+    def delete_ids(self, ids):
+        return self._call("delete_ids", sorted(set(ids)))
+
+    def complete_many(self, numbers):
+        return self._call("complete_many", sorted(set(numbers)))
+
+    def delete_many(self, numbers):
+        return self._call("delete_many", sorted(set(numbers)))
+
+
+def socket_path(store_name):
+    return SOCKET_FILE.format(store=store_name)
+
+
+def connect(store_name):
+    """Return a RemoteStore if a server for store_name is listening, else None."""
+    path = socket_path(store_name)
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return RemoteStore(sock)
+
+
+def serve(store, store_name):
+    """Run the server until interrupted, then save and remove the socket."""
+    path = socket_path(store_name)
+    if os.path.exists(path):
+        os.unlink(path)     # left behind by a server that did not shut down cleanly
+    server = TaskServer(store, path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.flush()
+        os.unlink(path)
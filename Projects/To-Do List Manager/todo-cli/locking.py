@@ -0,0 +1,129 @@
+"""Cross-process locking and group commit for the json store.
+
+Several `todo` processes (cron jobs, shell loops) may write at the same time.
+FileLock serialises them with flock on a lock file.  GroupCommit goes one
+step further: a writer first drops its request into a spool directory and
+only then waits for the lock.  Whoever gets the lock applies every queued
+request in one batch (one append, one fsync) and leaves each writer its
+result, so writers that were queued behind it find their work already done.
+If the batch fails, every request in it is dropped from the spool and each
+of its writers gets the error, so one bad request cannot block later writes.
+"""
+import itertools
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:     # Windows: no flock, so only threads are serialised
+    fcntl = None
+
+STALE_SECONDS = 600     # a spool file this old belongs to a writer that went away
+
+
+class CommitError(RuntimeError):
+    """A queued write failed in a batch applied by another writer."""
+
+
+class FileLock:
+    """Exclusive lock shared by threads and processes; re-entrant per thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            self._file = open(self.path, "a")
+            if fcntl:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+class GroupCommit:
+    """Queue write requests on disk and apply all waiting ones in one batch.
+
+    apply_batch receives a list of (op, arg) pairs while the lock is held
+    and must return one JSON-serialisable result per request.  If it
+    raises, the writer that ran the batch gets the exception and the others
+    get a CommitError.
+    """
+
+    _counter = itertools.count()
+
+    def __init__(self, spool_dir, lock, apply_batch):
+        self.spool_dir = spool_dir
+        self.lock = lock
+        self.apply_batch = apply_batch
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def _path(self, name, suffix):
+        return os.path.join(self.spool_dir, name + suffix)
+
+    def submit(self, op, arg):
+        """Queue one request, wait for it to be committed and return its result."""
+        # time first so that sorting the spool gives arrival order
+        name = "%020d-%d-%d-%d" % (time.time_ns(), os.getpid(),
+                                   threading.get_ident(), next(self._counter))
+        tmp_path = self._path(name, ".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump([op, arg], file)
+        os.replace(tmp_path, self._path(name, ".req"))
+        with self.lock:
+            if not os.path.exists(self._path(name, ".res")):
+                try:
+                    self._run_batch()
+                except Exception:
+                    if os.path.exists(self._path(name, ".res")):
+                        os.remove(self._path(name, ".res"))     # the exception is our reply
+                    raise
+        with open(self._path(name, ".res"), "r") as file:
+            reply = json.load(file)
+        os.remove(self._path(name, ".res"))
+        if "error" in reply:
+            raise CommitError(reply["error"])
+        return reply["result"]
+
+    def _run_batch(self):
+        entries = os.listdir(self.spool_dir)
+        self._sweep(entries)
+        names = sorted(entry[:-4] for entry in entries if entry.endswith(".req"))
+        try:
+            requests = []
+            for name in names:
+                with open(self._path(name, ".req"), "r") as file:
+                    requests.append(json.load(file))
+            replies = [{"result": result} for result in self.apply_batch(requests)]
+        except Exception as error:
+            self._finish(names, [{"error": f"{type(error).__name__}: {error}"}] * len(names))
+            raise
+        self._finish(names, replies)
+
+    def _finish(self, names, replies):
+        """Leave each writer its reply and take its request out of the spool."""
+        for name, reply in zip(names, replies):
+            with open(self._path(name, ".res"), "w") as file:
+                json.dump(reply, file)
+            os.remove(self._path(name, ".req"))
+
+    def _sweep(self, entries):
+        """Remove replies and half-written requests left by writers that died."""
+        cutoff = time.time_ns() - STALE_SECONDS * 10**9
+        for entry in entries:
+            if entry.endswith((".res", ".tmp")) and int(entry.split("-")[0]) < cutoff:
+                os.remove(os.path.join(self.spool_dir, entry))
@@ -0,0 +1,80 @@
+"""Filtering and paging shared by every task store."""
+import itertools
+
+
+def select_tasks(tasks, done=None, grep=None, offset=0, limit=None):
+    """Lazily yield (number, task) for matching tasks.
+
+    Numbers are positions in the full list, so they can be passed straight
+    to ``complete`` and ``delete``.  Nothing past offset + limit is read.
+    """
+    needle = grep.lower() if grep else None
+    matches = (
+        (number, task)
+        for number, task in enumerate(tasks, 1)
+        if (done is None or task["done"] == done)
+        and (needle is None or needle in task["task"].lower())
+    )
+    stop = None if limit is None else offset + limit
+    return itertools.islice(matches, offset, stop)
+
+
+def count_tasks(tasks, done=None, grep=None):
+    """Count matching tasks without keeping them around."""
+    return sum(1 for _ in select_tasks(tasks, done=done, grep=grep))
+
+
+def make_task(task_id, text, done=False, due=None, priority=None):
+    """A task dict; due (YYYY-MM-DD) and priority (1 = most urgent) only when set."""
+    task = {"id": task_id, "task": text, "done": bool(done)}
+    if due:
+        task["due"] = due
+    if priority:
+        task["priority"] = priority
+    return task
+
+
+class ByPosition:
+    """Positional complete/delete for stores that work by task id.
+
+    The list numbers shown by ``todo list`` are only a display convenience;
+    they are turned into ids with one pass that stops at the highest number.
+    """
+
+    def ids_at(self, numbers):
+        """Return {task id: number} for the numbers that are in range."""
+        wanted = set(n for n in numbers if n > 0)
+        found = {}
+        if wanted:
+            last = max(wanted)
+            for number, task in enumerate(self.iter_tasks(), 1):
+                if number in wanted:
+                    found[task["id"]] = number
+                if number == last:
+                    break
+        return found
+
+    def _by_number(self, tasks, ids):
+        return sorted(((ids[task["id"]], task) for task in tasks), key=lambda pair: pair[0])
+
+    def add(self, text, due=None, priority=None):
+        """Add a task and return it."""
+        return self.add_many([text], due=due, priority=priority)[0]
+
+    def complete(self, number):
+        """Mark task number as done; return it, or None if out of range."""
+        return dict(self.complete_many([number])).get(number)
+
+    def complete_many(self, numbers):
+        """Mark several tasks as done; return (number, task) for the valid ones."""
+        ids = self.ids_at(numbers)
+        return self._by_number(self.complete_ids(ids), ids)
+
+    def delete(self, number):
+        """Delete task number; return it, or None if out of range."""
+        return dict(self.delete_many([number])).get(number)
+
+    def delete_many(self, numbers):
+        """Delete several tasks; return (number, task) for the valid ones."""
+        ids = self.ids_at(numbers)
+        return self._by_number(self.delete_ids(ids), ids)
@@ -0,0 +1,62 @@
+"""Fast entry point for todo: answers counts without importing click or json.
+
+Shell prompt hooks run something like ``python quick.py list --pending
+--count`` before every prompt.  Most of the time in a full ``todo.py`` run
+goes to interpreter startup plus importing click, json, sqlite3 and the
+stores.  This script only imports os and summary.  It answers from
+todo.summary when it can:
+- list --count, optionally with --pending or --done;
+- a plain or filtered list that is known to be empty.
+Everything else goes to the full CLI in todo.py, which refreshes the summary.
+"""
+import os
+import sys
+import summary
+
+SOCKET_FILE = "todo.{store}.sock"   # same as daemon.SOCKET_FILE, without importing daemon
+FILTERS = {"--pending": False, "--done": True}
+
+
+def answer(argv):
+    """Return the output for argv if the summary can answer it, else None."""
+    store = os.environ.get("TODO_STORE", "json")
+    args = list(argv)
+    if args[:1] == ["--store"] and len(args) > 1:
+        store, args = args[1], args[2:]
+    elif args[:1] and args[0].startswith("--store="):
+        store, args = args[0].split("=", 1)[1], args[1:]
+    if store not in summary.DATA_FILES or args[:1] != ["list"]:
+        return None
+    if os.path.exists(SOCKET_FILE.format(store=store)):
+        return None     # a running `todo serve` may hold changes not saved yet
+    options = args[1:]
+    count_only = "--count" in options
+    if count_only:
+        options.remove("--count")
+    if len(options) > 1 or (options and options[0] not in FILTERS):
+        return None
+    counts = summary.read(store)
+    if counts is None:
+        return None
+    tasks, done = counts
+    done_filter = FILTERS[options[0]] if options else None
+    if done_filter is None:
+        matching = tasks
+    else:
+        matching = done if done_filter else tasks - done
+    if count_only:
+        return str(matching)
+    return "No Tasks found !" if matching == 0 else None
+
+
+def main():
+    output = answer(sys.argv[1:])
+    if output is not None:
+        print(output)
+        return
+    import todo
+    todo.cli(prog_name="todo")
+
+
+if __name__ == "__main__":
+    main()
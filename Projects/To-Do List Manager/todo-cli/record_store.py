@@ -0,0 +1,367 @@
+"""Record-file storage for the todo list.
+
+Tasks live in ``todo.jsonl``: a fixed-width header line with running counts,
+then one JSON record per task.  Every record starts with its id and two
+one-character flags::
+
+    {"id": 7, "done": 0, "deleted": 0, "task": "buy milk"}
+
+``todo.idx`` maps each id to the byte offset of its record (8 bytes per id),
+so completing a task is a seek plus a one-byte write, and deleting one flips
+its ``deleted`` flag into a tombstone instead of shifting the rest of the
+file.  Adding a task appends one record.  Once enough tombstones pile up the
+file is compacted on a background thread.  Ids are never reused.
+
+Writes from concurrent processes go through locking.GroupCommit: they are
+serialised by a lock on ``todo.lock`` and every writer that is waiting gets
+committed together with one fsync.  Whole-file rewrites go to a temp file
+that is renamed into place, so the file is never left half written.
+
+An old single-array ``todo.json`` is migrated on first use and kept as
+``todo.json.bak``.
+"""
+import json
+import os
+import struct
+import threading
+from array import array
+from locking import FileLock, GroupCommit
+from query import ByPosition, count_tasks, make_task, select_tasks
+
+TODO_FILE = "todo.json"          # old single-array format
+DATA_FILE = "todo.jsonl"
+INDEX_FILE = "todo.idx"
+LOCK_FILE = "todo.lock"
+SPOOL_DIR = "todo.spool"         # queued writes waiting for a group commit
+COMPACT_TOMBSTONES = 1000
+
+HEADER = '{"version": 2, "tasks": %10d, "done": %10d, "deleted": %10d}'
+OFFSET = struct.Struct("=Q")     # same layout as array("Q")
+
+
+def record_line(task_id, text, done=False, deleted=False, due=None, priority=None):
+    extra = ""
+    if due:
+        extra += ', "due": %s' % json.dumps(due)
+    if priority:
+        extra += ', "priority": %d' % priority
+    return '{"id": %d, "done": %d, "deleted": %d, "task": %s%s}' % (
+        task_id, done, deleted, json.dumps(text), extra)
+
+
+def flag_offsets(task_id):
+    """Byte offsets of the done and deleted flags inside a record."""
+    done_at = len('{"id": %d, "done": ' % task_id)
+    return done_at, done_at + len('0, "deleted": ')
+
+
+STALE = object()
+
+
+def task_view(record):
+    return make_task(record["id"], record["task"], record["done"],
+                     record.get("due"), record.get("priority"))
+
+
+class RecordStore(ByPosition):
+    """Task store backed by a records file plus an id -> offset index."""
+
+    def __init__(self, directory=".", compact_tombstones=COMPACT_TOMBSTONES):
+        self.legacy_path = os.path.join(directory, TODO_FILE)
+        self.data_path = os.path.join(directory, DATA_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.compact_tombstones = compact_tombstones
+        self._lock = FileLock(os.path.join(directory, LOCK_FILE))
+        self._group = GroupCommit(os.path.join(directory, SPOOL_DIR), self._lock, self._apply_batch)
+        self._compactor = None
+        with self._lock:
+            self._migrate()
+
+    # --- setup and migration ---
+
+    def _migrate(self):
+        """Convert an old todo.json and create missing files."""
+        if os.path.exists(self.data_path):
+            if not os.path.exists(self.index_path):
+                self.rebuild_index()
+        elif os.path.exists(self.legacy_path):
+            with open(self.legacy_path, "r") as file:
+                self.save(json.load(file))
+            os.replace(self.legacy_path, self.legacy_path + ".bak")
+        else:
+            self.save([])
+
+    def rebuild_index(self):
+        """Recreate todo.idx by scanning the records file."""
+        with self._lock:
+            offsets = {}
+            with open(self.data_path, "rb") as file:
+                file.readline()
+                offset = file.tell()
+                for line in file:
+                    if line.endswith(b"\n"):
+                        offsets[json.loads(line)["id"]] = offset
+                    offset += len(line)
+            size = max([self.next_id()] + [task_id + 1 for task_id in offsets])
+            index = array("Q", bytes(8 * size))
+            for task_id, offset in offsets.items():
+                index[task_id] = offset
+            self._write_index(index)
+
+    def _write_index(self, index):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            index.tofile(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def next_id(self):
+        """The id the next added task will get (entry 0 is never used)."""
+        try:
+            return max(1, os.path.getsize(self.index_path) // OFFSET.size)
+        except FileNotFoundError:
+            return 1
+
+    # --- reading ---
+
+    def _header(self):
+        with open(self.data_path, "r") as file:
+            return json.loads(file.readline())
+
+    def iter_tasks(self):
+        """Yield live tasks in order, reading the file one line at a time."""
+        with open(self.data_path, "r") as file:
+            file.readline()     # header
+            for line in file:
+                if not line.endswith("\n"):
+                    break       # another process is still writing this record
+                record = json.loads(line)
+                if not record["deleted"]:
+                    yield task_view(record)
+
+    def load(self):
+        """Return all tasks as a list."""
+        return list(self.iter_tasks())
+
+    def select(self, **filters):
+        return select_tasks(self.iter_tasks(), **filters)
+
+    def count(self, done=None, grep=None):
+        """Count tasks; without --grep the answer comes from the header."""
+        if grep:
+            return count_tasks(self.iter_tasks(), done=done, grep=grep)
+        header = self._header()
+        if done is None:
+            return header["tasks"]
+        return header["done"] if done else header["tasks"] - header["done"]
+
+    def _offsets(self, ids):
+        """Yield (id, offset) pairs; offset is 0 for ids that were never used."""
+        with open(self.index_path, "rb") as index:
+            for task_id in ids:
+                raw = b""
+                if task_id > 0:
+                    index.seek(task_id * OFFSET.size)
+                    raw = index.read(OFFSET.size)
+                yield task_id, OFFSET.unpack(raw)[0] if len(raw) == OFFSET.size else 0
+
+    # --- writing ---
+
+    def _rewrite(self, tasks, next_id):
+        """Write tasks (dicts with ids) as a fresh records file and index."""
+        index = array("Q", bytes(8 * next_id))
+        count = done = 0
+        tmp_path = self.data_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write((HEADER % (0, 0, 0) + "\n").encode())
+            for task in tasks:
+                index[task["id"]] = file.tell()
+                line = record_line(task["id"], task["task"], task["done"],
+                                   due=task.get("due"), priority=task.get("priority"))
+                file.write((line + "\n").encode())
+                count += 1
+                done += bool(task["done"])
+            file.seek(0)
+            file.write((HEADER % (count, done, 0)).encode())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.data_path)
+        self._write_index(index)
+
+    def save(self, tasks, next_id=None):
+        """Replace every task at once; tasks without an id get a new one.
+
+        next_id lets a caller that hands out ids itself (`todo serve`) make
+        sure ids it already used are not given out again.
+        """
+        with self._lock:
+            next_id = max([self.next_id(), next_id or 0] +
+                          [task["id"] + 1 for task in tasks if "id" in task])
+            numbered = []
+            for task in tasks:
+                if "id" not in task:
+                    task = {"id": next_id, **task}
+                    next_id += 1
+                numbered.append(make_task(task["id"], task["task"], task["done"],
+                                          task.get("due"), task.get("priority")))
+            self._rewrite(numbered, next_id)
+
+    def compact(self):
+        """Rewrite the records file without tombstones, keeping every id."""
+        with self._lock:
+            self._rewrite(self.iter_tasks(), self.next_id())
+
+    def _write_header(self, file, header):
+        file.seek(0)
+        file.write((HEADER % (header["tasks"], header["done"], header["deleted"])).encode())
+
+    def _drop_torn_tail(self, file):
+        """Cut off a record left half written by a process that died mid-append."""
+        end = file.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            step = min(4096, pos)
+            pos -= step
+            file.seek(pos)
+            chunk = file.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                if pos + newline + 1 != end:
+                    file.truncate(pos + newline + 1)
+                return
+
+    def _append(self, file, index, header, texts, due=None, priority=None):
+        """Append records for texts at the end of the file; return the new tasks."""
+        added = []
+        task_id = max(1, index.seek(0, os.SEEK_END) // OFFSET.size)
+        offset = file.seek(0, os.SEEK_END)
+        for text in texts:
+            line = (record_line(task_id, text, due=due, priority=priority) + "\n").encode()
+            file.write(line)
+            index.write(OFFSET.pack(offset))
+            added.append(make_task(task_id, text, due=due, priority=priority))
+            offset += len(line)
+            task_id += 1
+        header["tasks"] += len(added)
+        return added
+
+    def _flip(self, file, header, task_id, offset, flag):
+        """Set one flag byte of a record in place.
+
+        Returns the task, None if there is no live task with that id, or
+        STALE if the index points somewhere else (it is behind the file).
+        """
+        if not offset:
+            return None     # unknown id, or removed by compaction
+        file.seek(offset)
+        try:
+            record = json.loads(file.readline())
+        except ValueError:
+            record = {}
+        if record.get("id") != task_id:
+            return STALE
+        if record["deleted"]:
+            return None
+        done_at, deleted_at = flag_offsets(task_id)
+        if flag == "done" and not record["done"]:
+            file.seek(offset + done_at)
+            file.write(b"1")
+            header["done"] += 1
+        elif flag == "deleted":
+            file.seek(offset + deleted_at)
+            file.write(b"1")
+            header["tasks"] -= 1
+            header["deleted"] += 1
+            header["done"] -= record["done"]
+        record["done"] = record["done"] or flag == "done"
+        return task_view(record)
+
+    def _apply_batch(self, requests):
+        """Apply every queued write with a single sync; runs with the lock held.
+
+        Requests are ("add", [texts, due, priority]), ("done"/"deleted", ids) or
+        ("done_at"/"deleted_at", list positions).
+        """
+        results = [[] for _ in requests]
+        stale = []
+        with open(self.data_path, "r+b") as file:
+            self._drop_torn_tail(file)
+            if self._last_id(file) >= self.next_id():
+                # a writer died after appending records but before indexing them
+                self.rebuild_index()
+        with open(self.index_path, "r+b") as index, open(self.data_path, "r+b") as file:
+            header = json.loads(file.readline())
+            for i, (op, arg) in enumerate(requests):
+                if op == "add":
+                    results[i] = self._append(file, index, header, *arg)
+                    continue
+                flag, _, at = op.partition("_")
+                file.flush()
+                index.flush()
+                # positions are resolved here, under the lock, so they cannot shift
+                numbers = self.ids_at(arg) if at else dict.fromkeys(arg)
+                for task_id, offset in self._offsets(numbers):
+                    task = self._flip(file, header, task_id, offset, flag)
+                    if task is STALE:
+                        stale.append((i, numbers[task_id], task_id, flag))
+                    elif task:
+                        results[i].append(task if numbers[task_id] is None
+                                          else (numbers[task_id], task))
+            self._write_header(file, header)
+            file.flush()
+            os.fsync(file.fileno())
+            index.flush()
+            os.fsync(index.fileno())
+        if stale:
+            self.rebuild_index()
+            with open(self.data_path, "r+b") as file:
+                header = json.loads(file.readline())
+                for i, number, task_id, flag in stale:
+                    (_, offset), = self._offsets([task_id])
+                    task = self._flip(file, header, task_id, offset, flag)
+                    if task and task is not STALE:
+                        results[i].append(task if number is None else (number, task))
+                self._write_header(file, header)
+                file.flush()
+                os.fsync(file.fileno())
+        for (op, _), result in zip(requests, results):
+            if op.endswith("_at"):
+                result.sort(key=lambda pair: pair[0])
+        too_many = header["deleted"] > self.compact_tombstones
+        if too_many and not (self._compactor and self._compactor.is_alive()):
+            # non-daemon thread: the process waits for it before exiting
+            self._compactor = threading.Thread(target=self.compact, name="todo-compact")
+            self._compactor.start()
+        return results
+
+    def _last_id(self, file):
+        """Id of the last record in the file, or 0 if there are none."""
+        end = file.seek(0, os.SEEK_END)
+        file.seek(max(0, end - 64 * 1024))
+        for line in reversed(file.read().split(b"\n")):
+            try:
+                return json.loads(line)["id"]
+            except (ValueError, KeyError):
+                continue    # blank tail, header or a line cut by the seek
+        return 0
+
+    def add_many(self, texts, due=None, priority=None):
+        """Append one record per text; return the new tasks."""
+        return self._group.submit("add", [list(texts), due, priority])
+
+    def complete_ids(self, ids):
+        """Mark tasks done by id; return the tasks that exist."""
+        return self._group.submit("done", list(ids))
+
+    def delete_ids(self, ids):
+        """Tombstone tasks by id; return the tasks that were deleted."""
+        return self._group.submit("deleted", list(ids))
+
+    def complete_many(self, numbers):
+        """Mark tasks done by list position; return (number, task) pairs."""
+        return [tuple(pair) for pair in self._group.submit("done_at", list(numbers))]
+
+    def delete_many(self, numbers):
+        """Tombstone tasks by list position; return (number, task) pairs."""
+        return [tuple(pair) for pair in self._group.submit("deleted_at", list(numbers))]
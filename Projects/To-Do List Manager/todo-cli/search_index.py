@@ -0,0 +1,293 @@
+"""Persistent inverted index behind `todo search`.
+
+The words of every task are kept as (token, doc id) postings in a small
+SQLite file per store (``todo.json.index.db`` for the json store, and so
+on), so a query only touches the postings for its own terms instead of
+scanning every task.  Each group of AND-ed terms is read starting from its
+rarest term, in id order, and the other terms are checked one doc at a time
+through a second index on (doc id, token).  The query stops as soon as it
+has enough hits, so it never builds the full set of matches.  Doc ids are
+the tasks' own ids, which grow in list order, so a task's list position is
+its rank among the live doc ids.  IndexedStore keeps the index in step with
+add, complete and delete.
+
+The same file answers `todo next` and `todo overdue`.  Two partial indexes
+cover pending tasks only: one in urgency order (priority, then due date, then
+id) and one by due date.  SQLite keeps them as B-trees on disk, so the K most
+urgent tasks are the first K entries of the first index, and the overdue
+tasks are a binary search into the second one plus a short range scan.
+Neither query reads or sorts the rest of the list.  Their tasks are shown by
+id rather than list number, since a task's number would take a count of
+every live task before it.
+"""
+import os
+import re
+import sqlite3
+from query import make_task
+
+INDEX_FILE = "todo.{store}.index.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS docs (
+    id       INTEGER PRIMARY KEY,
+    task     TEXT    NOT NULL,
+    done     INTEGER NOT NULL,
+    due      TEXT,
+    priority INTEGER
+);
+CREATE INDEX IF NOT EXISTS docs_urgency ON docs (ifnull(priority, 9), ifnull(due, '9999-12-31'), id)
+    WHERE done = 0;
+CREATE INDEX IF NOT EXISTS docs_due ON docs (due) WHERE done = 0 AND due IS NOT NULL;
+CREATE TABLE IF NOT EXISTS postings (
+    token TEXT    NOT NULL,
+    id    INTEGER NOT NULL,
+    PRIMARY KEY (token, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_by_id ON postings (id, token);
+"""
+
+# must match docs_urgency so SQLite reads the index instead of sorting
+URGENCY = "ifnull(priority, 9), ifnull(due, '9999-12-31'), id"
+
+WORD = re.compile(r"\w+")
+RARE_POSTINGS = 10000   # a term with fewer postings than this is cheap to read and sort in full
+
+
+def tokenize(text):
+    return set(WORD.findall(text.lower()))
+
+
+def parse_query(query):
+    """Turn 'milk bre* OR eggs' into OR-groups of (token, is_prefix) AND-terms."""
+    groups = [[]]
+    for word in query.split():
+        if word == "OR":
+            groups.append([])
+            continue
+        if word == "AND":
+            continue
+        tokens = WORD.findall(word.lower())
+        for i, token in enumerate(tokens):
+            is_last = i == len(tokens) - 1
+            groups[-1].append((token, is_last and word.endswith("*")))
+    return [group for group in groups if group]
+
+
+class SearchIndex:
+    """Token -> doc id postings stored in the store's todo.<store>.index.db."""
+
+    def __init__(self, directory=".", store_name="json"):
+        self.path = os.path.join(directory, INDEX_FILE.format(store=store_name))
+        self.store_name = store_name
+        self.conn = sqlite3.connect(self.path, timeout=30)   # other todo processes may be writing
+        self.conn.executescript(SCHEMA)
+
+    def is_current(self):
+        """True once the index has been built from its store."""
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        return meta.get("store") == self.store_name
+
+    def rebuild(self, tasks):
+        """Index every task from scratch."""
+        with self.conn:
+            self.conn.execute("DELETE FROM docs")
+            self.conn.execute("DELETE FROM postings")
+            self._insert(tasks)
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('store', ?)",
+                              (self.store_name,))
+
+    def _insert(self, tasks):
+        for task in tasks:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO docs (id, task, done, due, priority) VALUES (?, ?, ?, ?, ?)",
+                (task["id"], task["task"], int(task["done"]), task.get("due"), task.get("priority")),
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO postings (token, id) VALUES (?, ?)",
+                ((token, task["id"]) for token in tokenize(task["task"])),
+            )
+
+    def add_tasks(self, tasks):
+        with self.conn:
+            self._insert(tasks)
+
+    def complete_ids(self, ids):
+        with self.conn:
+            self.conn.executemany("UPDATE docs SET done = 1 WHERE id = ?", ((i,) for i in ids))
+
+    def delete_ids(self, ids):
+        with self.conn:
+            for doc_id in ids:
+                row = self.conn.execute("SELECT task FROM docs WHERE id = ?", (doc_id,)).fetchone()
+                if row is None:
+                    continue
+                self.conn.executemany(
+                    "DELETE FROM postings WHERE token = ? AND id = ?",
+                    ((token, doc_id) for token in tokenize(row[0])),
+                )
+                self.conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+
+    def search(self, query, limit=20):
+        """Return (number, task) for tasks matching query, in list order.
+
+        Terms in a group must all match (AND); groups are joined with OR.
+        A term ending in * matches any word starting with it.
+        """
+        groups = parse_query(query)
+        if not groups:
+            return []
+        # the first `limit` ids of the union are among the first `limit` of each group
+        ids = sorted(set().union(*(self._group_ids(group, limit) for group in groups)))[:limit]
+        rows = self.conn.execute(
+            "SELECT id, task, done, due, priority FROM docs WHERE id IN (%s) ORDER BY id"
+            % ",".join("?" * len(ids)),
+            ids,
+        ).fetchall()
+        return self._numbered(rows)
+
+    def _group_ids(self, group, limit):
+        """The first limit doc ids, in id order, that match every term of group."""
+        terms = []  # (postings seen, is a prefix, condition on {t}.token, params)
+        for token, is_prefix in group:
+            if is_prefix:
+                # every token that sorts between "abc" and "abd" starts with "abc"
+                where, params = "{t}.token >= ? AND {t}.token < ?", [token, token[:-1] + chr(ord(token[-1]) + 1)]
+            else:
+                where, params = "{t}.token = ?", [token]
+            # count the term's postings, but stop counting at RARE_POSTINGS
+            postings = self.conn.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM postings AS p WHERE {where.format(t='p')} LIMIT ?)",
+                params + [RARE_POSTINGS],
+            ).fetchone()[0]
+            if not postings:
+                return []
+            terms.append((postings, is_prefix, where, params))
+        # start from the rarest term; for a tie, an exact word, whose postings are already in id order
+        terms.sort(key=lambda term: term[:2])
+        postings, is_prefix, where, params = terms[0]
+        if is_prefix and postings >= RARE_POSTINGS:
+            # a common prefix: walk the docs in id order until enough of them match
+            source = "postings AS p INDEXED BY postings_by_id"
+        else:
+            # read the term's postings by token (a prefix's few postings get sorted)
+            source = "postings AS p NOT INDEXED"
+        sql = f"SELECT DISTINCT p.id FROM {source} WHERE {where.format(t='p')}"
+        for _, _, other_where, other_params in terms[1:]:
+            sql += f" AND EXISTS (SELECT 1 FROM postings AS q WHERE q.id = p.id AND {other_where.format(t='q')})"
+            params = params + other_params
+        rows = self.conn.execute(sql + " ORDER BY p.id LIMIT ?", params + [limit])
+        return [doc_id for (doc_id,) in rows]
+
+    def next_tasks(self, limit=5):
+        """The limit most urgent pending tasks.
+
+        Lower priority numbers come first, then earlier due dates; tasks
+        without a priority or due date sort after those with one.
+        """
+        rows = self.conn.execute(
+            "SELECT id, task, done, due, priority FROM docs WHERE done = 0"
+            f" ORDER BY {URGENCY} LIMIT ?",
+            (limit,),
+        )
+        return [make_task(*row) for row in rows]
+
+    def overdue(self, today, limit=None):
+        """Pending tasks due before today (YYYY-MM-DD), earliest first."""
+        rows = self.conn.execute(
+            "SELECT id, task, done, due, priority FROM docs"
+            " WHERE done = 0 AND due IS NOT NULL AND due < ? ORDER BY due, id LIMIT ?",
+            (today, -1 if limit is None else limit),
+        )
+        return [make_task(*row) for row in rows]
+
+    def _numbered(self, rows):
+        """Pair each row with its list number."""
+        # a task's number is how many live docs come before it, plus one;
+        # walk the hits in id order so the counts cover each range only once
+        numbers = {}
+        number = 0
+        previous = 0
+        for doc_id in sorted(row[0] for row in rows):
+            number += self.conn.execute(
+                "SELECT COUNT(*) FROM docs WHERE id > ? AND id <= ?", (previous, doc_id)
+            ).fetchone()[0]
+            previous = doc_id
+            numbers[doc_id] = number
+        return [(numbers[row[0]], make_task(*row)) for row in rows]
+
+
+class IndexedStore:
+    """Wraps a task store and keeps a SearchIndex in step with its changes."""
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getattr__(self, name):
+        # reads (load, select, count, ...) go straight to the real store
+        return getattr(self.store, name)
+
+    def _ensure_index(self):
+        if not self.index.is_current():
+            self.index.rebuild(self.store.iter_tasks())
+
+    def search(self, query, limit=20):
+        self._ensure_index()
+        return self.index.search(query, limit)
+
+    def save(self, tasks, next_id=None):
+        self.store.save(tasks, next_id)
+        self.index.rebuild(self.store.iter_tasks())
+
+    def import_tasks(self, tasks):
+        count = self.store.import_tasks(tasks)
+        self.index.rebuild(self.store.iter_tasks())
+        return count
+
+    def next_tasks(self, limit=5):
+        self._ensure_index()
+        return self.index.next_tasks(limit)
+
+    def overdue(self, today, limit=None):
+        self._ensure_index()
+        return self.index.overdue(today, limit)
+
+    def add(self, text, due=None, priority=None):
+        return self.add_many([text], due=due, priority=priority)[0]
+
+    def add_many(self, texts, due=None, priority=None):
+        self._ensure_index()
+        added = self.store.add_many(texts, due=due, priority=priority)
+        self.index.add_tasks(added)
+        return added
+
+    def complete(self, number):
+        return dict(self.complete_many([number])).get(number)
+
+    def complete_many(self, numbers):
+        self._ensure_index()
+        completed = self.store.complete_many(numbers)
+        self.index.complete_ids([task["id"] for _, task in completed])
+        return completed
+
+    def complete_ids(self, ids):
+        self._ensure_index()
+        completed = self.store.complete_ids(ids)
+        self.index.complete_ids([task["id"] for task in completed])
+        return completed
+
+    def delete(self, number):
+        return dict(self.delete_many([number])).get(number)
+
+    def delete_many(self, numbers):
+        self._ensure_index()
+        deleted = self.store.delete_many(numbers)
+        self.index.delete_ids([task["id"] for _, task in deleted])
+        return deleted
+
+    def delete_ids(self, ids):
+        self._ensure_index()
+        deleted = self.store.delete_ids(ids)
+        self.index.delete_ids([task["id"] for task in deleted])
+        return deleted
@@ -0,0 +1,149 @@
+"""SQLite storage for the todo list.
+
+Each task is one row keyed by an integer primary key, which doubles as the
+task's stable id, so completing or deleting a task touches a single row
+instead of re-serialising the list.  AUTOINCREMENT keeps ids from being
+reused.  Task numbers shown by the CLI are still positions in creation order.
+"""
+import json
+import os
+import sqlite3
+import time
+from query import ByPosition, make_task, select_tasks
+
+DB_FILE = "todo.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    task       TEXT    NOT NULL,
+    done       INTEGER NOT NULL DEFAULT 0,
+    created_at REAL    NOT NULL,
+    due        TEXT,
+    priority   INTEGER
+);
+CREATE INDEX IF NOT EXISTS tasks_done ON tasks (done);
+CREATE INDEX IF NOT EXISTS tasks_created_at ON tasks (created_at);
+"""
+
+
+COLUMNS = "id, task, done, due, priority"
+
+
+def row_to_task(row):
+    return make_task(*row)
+
+
+class SqliteStore(ByPosition):
+    """Task store backed by a single SQLite table."""
+
+    def __init__(self, directory="."):
+        self.path = os.path.join(directory, DB_FILE)
+        # `todo serve` saves from a background thread; other processes may
+        # hold the write lock for a moment, so wait for it instead of failing
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")    # readers don't block the writer
+        self.conn.executescript(SCHEMA)
+
+    def iter_tasks(self):
+        """Yield tasks in creation order straight off the cursor."""
+        for row in self.conn.execute(f"SELECT {COLUMNS} FROM tasks ORDER BY id"):
+            yield row_to_task(row)
+
+    def load(self):
+        """Return all tasks in creation order."""
+        return list(self.iter_tasks())
+
+    def select(self, **filters):
+        return select_tasks(self.iter_tasks(), **filters)
+
+    def count(self, done=None, grep=None):
+        """Count tasks with one indexed query."""
+        sql = "SELECT COUNT(*) FROM tasks WHERE 1"
+        params = []
+        if done is not None:
+            sql += " AND done = ?"
+            params.append(int(done))
+        if grep:
+            sql += " AND instr(lower(task), ?) > 0"
+            params.append(grep.lower())
+        return self.conn.execute(sql, params).fetchone()[0]
+
+    def save(self, tasks, next_id=None):
+        """Replace every task at once, keeping the ids of tasks that have one."""
+        with self.conn:
+            self.conn.execute("DELETE FROM tasks")
+            self.import_tasks(tasks)
+            if next_id:
+                # never hand out an id the caller has already used
+                updated = self.conn.execute(
+                    "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'tasks'",
+                    (next_id - 1,),
+                ).rowcount
+                if not updated:
+                    self.conn.execute(
+                        "INSERT INTO sqlite_sequence (name, seq) VALUES ('tasks', ?)",
+                        (next_id - 1,),
+                    )
+
+    def import_tasks(self, tasks):
+        """Insert a list of task dicts in one transaction; return how many."""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO tasks (id, task, done, created_at, due, priority)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                ((task.get("id"), task["task"], int(task.get("done", False)), now,
+                  task.get("due"), task.get("priority")) for task in tasks),
+            )
+        return len(tasks)
+
+    def next_id(self):
+        row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'tasks'").fetchone()
+        return (row[0] if row else 0) + 1
+
+    def add_many(self, texts, due=None, priority=None):
+        """Add tasks from any iterable of strings in one transaction; return them."""
+        now = time.time()
+        added = []
+        with self.conn:
+            for text in texts:
+                task_id = self.conn.execute(
+                    "INSERT INTO tasks (task, done, created_at, due, priority) VALUES (?, 0, ?, ?, ?)",
+                    (text, now, due, priority),
+                ).lastrowid
+                added.append(make_task(task_id, text, due=due, priority=priority))
+        return added
+
+    def _rows(self, ids):
+        ids = sorted(set(ids))
+        rows = []
+        for start in range(0, len(ids), 500):   # stay under SQLite's variable limit
+            chunk = ids[start:start + 500]
+            rows += self.conn.execute(
+                f"SELECT {COLUMNS} FROM tasks WHERE id IN (%s)" % ",".join("?" * len(chunk)),
+                chunk,
+            ).fetchall()
+        return rows
+
+    def complete_ids(self, ids):
+        """Mark tasks done by id; return the tasks that exist."""
+        rows = self._rows(ids)
+        with self.conn:
+            self.conn.executemany("UPDATE tasks SET done = 1 WHERE id = ?", ((row[0],) for row in rows))
+        return [make_task(row[0], row[1], True, *row[3:]) for row in rows]
+
+    def delete_ids(self, ids):
+        """Delete tasks by id; return the tasks that were deleted."""
+        rows = self._rows(ids)
+        with self.conn:
+            self.conn.executemany("DELETE FROM tasks WHERE id = ?", ((row[0],) for row in rows))
+        return [row_to_task(row) for row in rows]
+
+
+def import_json(store, path):
+    """One-shot import of an old todo.json array into a SqliteStore."""
+    with open(path, "r") as file:
+        tasks = json.load(file)
+    # ids in a plain todo.json array are positions, not stable ids
+    return store.import_tasks([{"task": t["task"], "done": t["done"]} for t in tasks])
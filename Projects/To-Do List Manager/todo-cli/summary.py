@@ -0,0 +1,67 @@
+"""A tiny cache of the task counts for quick.py.
+
+``todo.summary`` is one line: the store name, a stamp of the store's files
+(mtime and size of each) and the task and done counts.  The counts are only
+trusted while the stamp still matches, and commands that change tasks
+delete the file up front.  Only the standard os module is needed to read it.
+"""
+import os
+import time
+
+SUMMARY_FILE = "todo.summary"
+DATA_FILES = {
+    "json": ["todo.jsonl"],
+    "sqlite": ["todo.db", "todo.db-wal"],
+    "binary": ["todo.bin"],
+}
+RACY_SECONDS = 2    # a file changed this recently may change again within the same mtime tick
+
+
+def stamp(store_name, directory="."):
+    """Describe the store's files; any write changes the result."""
+    parts = []
+    for name in DATA_FILES[store_name]:
+        try:
+            info = os.stat(os.path.join(directory, name))
+        except FileNotFoundError:
+            parts.append("-")
+            continue
+        parts.append(f"{info.st_mtime_ns}:{info.st_size}")
+    return ",".join(parts)
+
+
+def read(store_name, directory="."):
+    """Return (tasks, done) if the cached counts still match the store, else None."""
+    try:
+        with open(os.path.join(directory, SUMMARY_FILE), "r") as file:
+            name, cached_stamp, tasks, done = file.read().split()
+    except (OSError, ValueError):
+        return None
+    if name != store_name or cached_stamp != stamp(store_name, directory):
+        return None
+    return int(tasks), int(done)
+
+
+def write(store_name, taken_stamp, tasks, done, directory="."):
+    """Cache counts computed after taken_stamp was taken.
+
+    Taking the stamp first means a write that lands while counting makes
+    the cache stale instead of wrong.  Files written in the last couple of
+    seconds are not cached at all, since a second write in the same mtime
+    tick could leave the stamp unchanged.
+    """
+    recent = time.time_ns() - RACY_SECONDS * 10**9
+    for part in taken_stamp.split(","):
+        if part != "-" and int(part.split(":")[0]) > recent:
+            return
+    path = os.path.join(directory, SUMMARY_FILE)
+    with open(path + ".tmp", "w") as file:
+        file.write(f"{store_name} {taken_stamp} {tasks} {done}\n")
+    os.replace(path + ".tmp", path)
+
+
+def invalidate(directory="."):
+    try:
+        os.remove(os.path.join(directory, SUMMARY_FILE))
+    except FileNotFoundError:
+        pass
@@ -1,73 +1,274 @@
 import click    # to create a cli
-import json     #to save and load tasks from a file
-import os       #to check if the file exists
+import datetime
+import signal
+import sys
+import daemon                      # `todo serve` and its socket client
+import summary                     # cached counts read by quick.py
+from binary_store import BinaryStore   # compact format read through mmap
+from record_store import RecordStore   # records file + id -> offset index
+from sqlite_store import SqliteStore, import_json
+from search_index import IndexedStore, SearchIndex
 
-TODO_FILE = "todo.json"
+STORES = {"json": RecordStore, "sqlite": SqliteStore, "binary": BinaryStore}
+WRITE_COMMANDS = {"add", "complete", "delete", "import-json", "convert", "serve"}
 
-def load_tasks():
-    if not os.path.exists(TODO_FILE):
-            return []
-    with open(TODO_FILE, "r") as file:
-            return json.load(file)
+def get_store(name="json"):
+    return STORES[name]()
 
-def save_tasks(tasks):
-       with open(TODO_FILE, "w") as file:
-            json.dump(tasks, file, indent=4)
+class TaskNumbers(click.ParamType):
+    """A task number like 7 or an inclusive range like 1-500."""
+    name = "N|N-M"
+
+    def convert(self, value, param, ctx):
+        start, dash, end = value.partition("-")
+        try:
+            first = int(start)
+            last = int(end) if dash else first
+        except ValueError:
+            self.fail(f"{value!r} is not a task number or range", param, ctx)
+        if last < first:
+            self.fail(f"{value!r} ends before it starts", param, ctx)
+        return range(first, last + 1)
+
+def flatten(ranges):
+    return [number for numbers in ranges for number in numbers]
+
+def report_invalid(asked, found, by_id=False):
+      what = "task id" if by_id else "task number"
+      for number in sorted(set(asked) - {number for number, _ in found}):
+            click.echo(f"Invalid {what}! : {number}")
+
+def format_task(number, task):
+      status = "✅" if task["done"] else '❌'
+      if number is None:    # shown by id only
+            line = f"#{task['id']} {task['task']} [{status}]"
+      else:
+            line = f"{number}. {task['task']} [{status}] #{task['id']}"
+      if task.get("priority"):
+            line += f" P{task['priority']}"
+      if task.get("due"):
+            line += f" due {task['due']}"
+      return line
+
+def echo_tasks(tasks):
+      """Print tasks by id; `complete --id` and `delete --id` take these ids."""
+      if not tasks:
+            click.echo("No Tasks found !")
+      for task in tasks:
+            click.echo(format_task(None, task))
+
+def remember_counts(store):
+      """Refresh todo.summary so quick.py can answer the next count by itself."""
+      if isinstance(store.store, daemon.RemoteStore):
+            return      # the server's tasks may not be on disk yet
+      name = click.get_current_context().find_root().params["store"]
+      stamp = summary.stamp(name)
+      summary.write(name, stamp, store.count(), store.count(done=True))
+
+def refuse_while_served(*names):
+      """Refuse to touch a store directly while a server holds it in memory.
+
+      The server's next save would undo what was written, and its unsaved
+      changes are not on disk to be read.
+      """
+      for name in names:
+            server = daemon.connect(name)
+            if server:
+                  server.sock.close()
+                  raise click.ClickException(f"A todo server for the {name} store is running; stop it first.")
+
+def by_id_or_number(store, numbers, by_id, action):
+      """Run complete/delete on ids or positions; return (label, task) pairs."""
+      if by_id:
+            tasks = getattr(store, f"{action}_ids")(numbers)
+            return [(task["id"], task) for task in tasks]
+      return getattr(store, f"{action}_many")(numbers)
 
 @click.group()
-def cli():
+@click.option("--store", type=click.Choice(sorted(STORES)), default="json",
+              envvar="TODO_STORE", show_default=True, help="Where tasks are kept.")
+@click.pass_context
+def cli(ctx, store):
     """A simple command-line TODO list manager."""
-    pass
+    if ctx.invoked_subcommand in WRITE_COMMANDS:
+        summary.invalidate()
+    if ctx.invoked_subcommand == "serve":
+        ctx.obj = get_store(store)
+    else:
+        # talk to a running `todo serve` for this store if there is one
+        tasks = daemon.connect(store) or get_store(store)
+        ctx.obj = IndexedStore(tasks, SearchIndex(store_name=store))
 
 @click.command()
-@click.argument("task")
-def add(task):
+@click.argument("task", required=False)
+@click.option("--from-file", type=click.File("r"),
+              help="Add one task per line from a file, or - for stdin.")
+@click.option("--due", type=click.DateTime(formats=["%Y-%m-%d"]), help="Due date, YYYY-MM-DD.")
+@click.option("--priority", "-p", type=click.IntRange(1, 5), help="1 (most urgent) to 5.")
+@click.pass_obj
+def add(store, task, from_file, due, priority):
       """Add a new task to the list."""
-      tasks = load_tasks()
-      tasks.append({"task": task, "done": False})
-      save_tasks(tasks)
-      click.echo(f"Task Added Successfully: {task}")
+      due = due.date().isoformat() if due else None
+      if from_file:
+            lines = (line.strip() for line in from_file)
+            added = store.add_many((line for line in lines if line), due=due, priority=priority)
+            click.echo(f"Added {len(added)} tasks.")
+      elif task:
+            added = store.add(task, due=due, priority=priority)
+            click.echo(f"Task Added Successfully: {task} (id #{added['id']})")
+      else:
+            raise click.UsageError("Give a TASK or --from-file.")
 
 
 
 
 @click.command()
-def list():
-      """List all tasks."""
-      tasks = load_tasks()
-      if not tasks:
-            click.echo("No Tasks found !")
+@click.option("--pending", "done", flag_value=False, default=None, help="Only unfinished tasks.")
+@click.option("--done", "done", flag_value=True, help="Only completed tasks.")
+@click.option("--grep", metavar="TEXT", help="Only tasks containing TEXT (any case).")
+@click.option("--offset", type=click.IntRange(min=0), default=0, help="Skip this many matches.")
+@click.option("--limit", type=click.IntRange(min=0), help="Show at most this many matches.")
+@click.option("--count", "count_only", is_flag=True, help="Print how many tasks match.")
+@click.pass_obj
+def list(store, done, grep, offset, limit, count_only):
+      """List tasks, optionally filtered and paged."""
+      if count_only:
+            click.echo(store.count(done=done, grep=grep))
+            if grep is None:
+                  remember_counts(store)
             return
-      for index, task in enumerate(tasks, 1):
-            status = "✅" if task["done"] else '❌'
-            click.echo(f"{index}. {task['task']} [{status}] ")
+      lines = []
+      shown = 0
+      for number, task in store.select(done=done, grep=grep, offset=offset, limit=limit):
+            lines.append(format_task(number, task))
+            shown += 1
+            if len(lines) == 1000:      # print in batches instead of line by line
+                  click.echo("\n".join(lines))
+                  lines = []
+      if lines:
+            click.echo("\n".join(lines))
+      if not shown:
+            click.echo("No Tasks found !")
+            if grep is None and not offset:
+                  remember_counts(store)
+
+@click.command()
+@click.argument("task_numbers", nargs=-1, required=True, type=TaskNumbers())
+@click.option("--id", "by_id", is_flag=True, help="Treat the numbers as task ids (#7), not list positions.")
+@click.pass_obj
+def complete(store, task_numbers, by_id):
+      """Mark tasks as completed, e.g. `complete 3` or `complete 1-500 712`."""
+      numbers = flatten(task_numbers)
+      completed = by_id_or_number(store, numbers, by_id, "complete")
+      if len(completed) == 1:
+            label = "#" if by_id else ""
+            click.echo(f"Task {label}{completed[0][0]} marked as completed.")
+      elif completed:
+            click.echo(f"{len(completed)} tasks marked as completed.")
+      report_invalid(numbers, completed, by_id)
+
+@click.command()
+@click.argument("task_numbers", nargs=-1, required=True, type=TaskNumbers())
+@click.option("--id", "by_id", is_flag=True, help="Treat the numbers as task ids (#7), not list positions.")
+@click.pass_obj
+def delete(store, task_numbers, by_id):
+      """Delete tasks, e.g. `delete 3` or `delete 2-4 9`."""
+      numbers = flatten(task_numbers)
+      deleted = by_id_or_number(store, numbers, by_id, "delete")
+      if len(deleted) == 1:
+            click.echo(f"Deleted Task : {deleted[0][1]['task']} ")
+      elif deleted:
+            click.echo(f"Deleted {len(deleted)} tasks.")
+      report_invalid(numbers, deleted, by_id)
+
+@click.command()
+@click.argument("query")
+@click.option("--limit", type=click.IntRange(min=1), default=20, show_default=True)
+@click.option("--rebuild", is_flag=True, help="Re-index every task first.")
+@click.pass_obj
+def search(store, query, limit, rebuild):
+      """Find tasks by words: `search "milk eggs"`, `search "milk OR bread"`, `search "gro*"`."""
+      if rebuild:
+            store.index.rebuild(store.iter_tasks())
+      results = store.search(query, limit)
+      if not results:
+            click.echo("No matching tasks.")
+      for number, task in results:
+            click.echo(format_task(number, task))
+
+@click.command("next")
+@click.option("-n", "limit", type=click.IntRange(min=1), default=5, show_default=True,
+              help="How many tasks to show.")
+@click.pass_obj
+def next_command(store, limit):
+      """Show the most urgent pending tasks: by priority, then due date.
+
+      Tasks are shown by id, e.g. `complete --id 7`.
+      """
+      echo_tasks(store.next_tasks(limit))
 
 @click.command()
-@click.argument("task_number", type=int)
-def complete(task_number):
-      """Mark a task as completed."""
-      tasks= load_tasks()
-      if 0 < task_number <= len(tasks):
-            tasks[task_number - 1]["done"] = True
-            save_tasks(tasks)
-            click.echo(f"Task {task_number} marked as completed.")
+@click.pass_obj
+def overdue(store):
+      """Show pending tasks whose due date has passed, oldest first, by id."""
+      echo_tasks(store.overdue(datetime.date.today().isoformat()))
+
+@click.command("import-json")
+@click.argument("path", required=False, type=click.Path(exists=True, dir_okay=False))
+def import_json_command(path):
+      """Copy tasks from todo.json (or the json store) into todo.db."""
+      refuse_while_served("sqlite", *([] if path else ["json"]))
+      # through IndexedStore, so search, next and overdue see the imported tasks
+      sqlite = IndexedStore(SqliteStore(), SearchIndex(store_name="sqlite"))
+      if path:
+            count = import_json(sqlite, path)
       else:
-        click.echo(f"Invalid task number! : {task_number}")
+            # json store ids mean nothing in todo.db; the tasks get new ids after its own
+            tasks = RecordStore().load()
+            for task in tasks:
+                  del task["id"]
+            count = sqlite.import_tasks(tasks)
+      click.echo(f"Imported {count} tasks into {sqlite.path}")
 
 @click.command()
-@click.argument("task_number", type=int)
-def delete(task_number):
-      """Delete a task from the list."""
-      tasks = load_tasks()
-      if 0 < task_number <= len(tasks):
-            deleted_task = tasks.pop(task_number - 1)
-            save_tasks(tasks)
-            click.echo(f"Deleted Task : {deleted_task['task']} ")
+@click.argument("source", type=click.Choice(sorted(STORES)))
+@click.argument("target", type=click.Choice(sorted(STORES)))
+def convert(source, target):
+      """Copy every task, with its id, between stores: `convert json binary`."""
+      if source == target:
+            raise click.UsageError("SOURCE and TARGET must differ.")
+      refuse_while_served(source, target)
+      source_store = get_store(source)
+      tasks = source_store.load()
+      target_store = IndexedStore(get_store(target), SearchIndex(store_name=target))
+      target_store.save(tasks, source_store.next_id())     # re-indexes the target too
+      click.echo(f"Copied {len(tasks)} tasks from {source} to {target}.")
+
+@click.command()
+@click.pass_context
+def serve(ctx):
+      """Keep tasks in memory and answer other todo commands over a socket."""
+      name = ctx.find_root().params["store"]
+      if daemon.connect(name):
+            click.echo(f"A todo server for the {name} store is already running.")
+            return
+      signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+      click.echo(f"Serving tasks on {daemon.socket_path(name)} (Ctrl+C to stop)")
+      try:
+            daemon.serve(ctx.obj, name)
+      except KeyboardInterrupt:
+            pass
 
 cli.add_command(add)
 cli.add_command(list)
 cli.add_command(complete)
 cli.add_command(delete)
+cli.add_command(import_json_command)
+cli.add_command(convert)
+cli.add_command(serve)
+cli.add_command(search)
+cli.add_command(next_command)
+cli.add_command(overdue)
 
 if __name__ == "__main__":
       cli()